@@ -1,10 +1,43 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import random
-from collections import deque
+import copy
 import os
 import threading
+import warnings
+
+from Checkpoint import CheckpointManager, get_writer, cpu_copy
+from ReplayBuffer import ReplayBuffer, MemmapReplayBuffer, PrioritizedReplay
+from SubGraph import MODEL_FILE
+
+def build_q_net(state_dim, action_dim):
+    return nn.Sequential(
+        nn.Linear(state_dim, 128),
+        nn.ReLU(),
+        nn.Linear(128, 128),
+        nn.ReLU(),
+        nn.Linear(128, action_dim)
+    )
+
+def load_weights(net, state_dict, source) -> bool:
+    """Load saved weights into net, or leave it untrained if they were saved for a different state or action size."""
+    try:
+        net.load_state_dict(state_dict)
+    except RuntimeError as e:
+        print(f"Weights from {source} do not fit this network, starting fresh: {e}")
+        return False
+    return True
+
+def masked_q(q_values, mask):
+    """Q values with invalid action slots at -inf. Rows with no valid slot are left as they are."""
+    mask = mask | ~mask.any(dim=-1, keepdim=True)
+    return q_values.masked_fill(~mask, float('-inf'))
+
+def random_action(action_dim, mask=None):
+    valid = [i for i in range(action_dim) if mask is None or mask[i]]
+    return random.choice(valid) if valid else random.randrange(action_dim)
 
 class DQNAgent:
     def __init__(
@@ -21,7 +54,18 @@ class DQNAgent:
         target_update=1000,
         device="cpu",
         model_path=None,
-        save_interval=100
+        save_interval=100,
+        snapshot_interval=10,
+        checkpoint_keep=5,
+        checkpoint_version_every=10,
+        initial_weights=None,
+        replay_dir=None,
+        replay_disk_bytes=None,
+        replay_state_dtype='float32',
+        prioritized=False,
+        priority_alpha=0.6,
+        priority_beta=0.4,
+        priority_beta_steps=100_000
     ):
         self.state_dim = state_dim
         self.action_dim = action_dim
@@ -33,68 +77,103 @@ class DQNAgent:
         self.target_update = target_update
         self.device = device
         self.save_interval = save_interval
+        self.snapshot_interval = snapshot_interval
+        self.priority_beta = priority_beta
+        self.priority_beta_steps = priority_beta_steps
         self.last_loss = 0.0
         self.lock = threading.Lock()
 
         if model_path is None:
-            self.model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_eval.pth')
+            self.model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_FILE)
         else:
             self.model_path = model_path
+        self.checkpoints = CheckpointManager(self.model_path, keep=checkpoint_keep, version_every=checkpoint_version_every)
 
         self.q_net = self._build_net().to(device)
-        if os.path.exists(self.model_path):
-            self.q_net.load_state_dict(torch.load(self.model_path, weights_only=True))
-            print(f"Model Loaded from {self.model_path}!")
+        if initial_weights is not None:
+            load_weights(self.q_net, initial_weights, 'the shared pool')
+        elif os.path.exists(self.model_path):
+            if load_weights(self.q_net, torch.load(self.model_path, weights_only=True), self.model_path):
+                print(f"Model Loaded from {self.model_path}!")
         self.target_net = self._build_net().to(device)
         self.target_net.load_state_dict(self.q_net.state_dict())
         self.target_net.eval()
 
         self.optimizer = optim.Adam(self.q_net.parameters(), lr=lr)
-        self.replay = deque(maxlen=buffer_size)
+        if replay_dir is not None:
+            # On disk, the byte budget rather than buffer_size decides how many transitions fit
+            if replay_disk_bytes is not None:
+                buffer_size = MemmapReplayBuffer.capacity_for(replay_disk_bytes, state_dim, replay_state_dtype, action_dim)
+            self.replay = MemmapReplayBuffer(replay_dir, buffer_size, state_dim, replay_state_dtype, action_dim)
+        else:
+            self.replay = ReplayBuffer(buffer_size)
+        # Replays surprising transitions (completed sub graphs, high-priority roads) more often than routine re-cleans
+        self.prioritized = prioritized
+        if prioritized:
+            self.replay = PrioritizedReplay(self.replay, priority_alpha)
 
         self.step_count = 0
+        self.snapshot_count = 0
+        self._publish_snapshot()
 
     def _build_net(self):
-        return nn.Sequential(
-            nn.Linear(self.state_dim, 128),
-            nn.ReLU(),
-            nn.Linear(128, 128),
-            nn.ReLU(),
-            nn.Linear(128, self.action_dim)
-        )
-
-    def act(self, state):
-        with self.lock:
-            if random.random() < self.epsilon:
-                return random.randrange(self.action_dim)
+        return build_q_net(self.state_dim, self.action_dim)
 
-            state_tensor = torch.tensor(state, dtype=torch.float32, device=self.device).unsqueeze(0)
-            with torch.no_grad():
-                return self.q_net(state_tensor).argmax(dim=1).item()
+    def _publish_snapshot(self):
+        # A fresh frozen copy is swapped in with a single reference assignment, so act()
+        # never waits on train() and never sees a half-updated network.
+        snapshot = copy.deepcopy(self.q_net)
+        snapshot.eval()
+        snapshot.requires_grad_(False)
+        self.policy_net = snapshot
+        self.snapshot_count += 1
+
+    def act(self, state, mask=None):
+        """Epsilon-greedy action for state, choosing only among the slots mask marks valid (all of them if None)."""
+        if random.random() < self.epsilon:
+            return random_action(self.action_dim, mask)
+
+        policy_net = self.policy_net
+        state_tensor = torch.tensor(state, dtype=torch.float32, device=self.device).unsqueeze(0)
+        with torch.no_grad():
+            q_values = policy_net(state_tensor)
+            if mask is not None:
+                q_values = masked_q(q_values, torch.tensor(mask, dtype=torch.bool, device=self.device).unsqueeze(0))
+            return q_values.argmax(dim=1).item()
 
-    def remember(self, state, action, reward, next_state, done):
-        self.replay.append((state, action, reward, next_state, done))
+    def remember(self, state, action, reward, next_state, done, next_mask=None):
+        if next_mask is None:
+            next_mask = (True,) * self.action_dim
+        self.replay.append(state, action, reward, next_state, done, next_mask)
 
     def train(self):
         with self.lock:
             if len(self.replay) < self.batch_size:
                 return
 
-            batch = random.sample(self.replay, self.batch_size)
-            states, actions, rewards, next_states, dones = zip(*batch)
-            states = torch.tensor(states, dtype=torch.float32, device=self.device)
-            next_states = torch.tensor(next_states, dtype=torch.float32, device=self.device)
-            actions = torch.tensor(actions, dtype=torch.long, device=self.device)
-            rewards = torch.tensor(rewards, dtype=torch.float32, device=self.device)
-            dones = torch.tensor(dones, dtype=torch.float32, device=self.device)
+            if self.prioritized:
+                # Importance-sampling correction anneals to full strength over priority_beta_steps
+                beta = min(1.0, self.priority_beta + (1.0 - self.priority_beta) * self.step_count / self.priority_beta_steps)
+                *batch, weights, indices = self.replay.sample(self.batch_size, beta)
+            else:
+                batch = self.replay.sample(self.batch_size)
+            states, actions, rewards, next_states, dones, next_masks = (
+                torch.from_numpy(x).to(self.device) for x in batch
+            )
 
             q_values = self.q_net(states).gather(1, actions.unsqueeze(1)).squeeze(1)
 
             with torch.no_grad():
-                next_q = self.target_net(next_states).max(1)[0]
+                # The best next action is taken over the moves that exist from the next node
+                next_q = masked_q(self.target_net(next_states), next_masks).max(1)[0]
                 target = rewards + self.gamma * next_q * (1 - dones)
 
-            loss = nn.functional.mse_loss(q_values, target)
+            if self.prioritized:
+                td_errors = target - q_values
+                loss = (torch.from_numpy(weights).to(self.device) * td_errors.pow(2)).mean()
+                self.replay.update_priorities(indices, td_errors.detach().cpu().numpy())
+            else:
+                loss = nn.functional.mse_loss(q_values, target)
             self.last_loss = loss.item()
 
             self.optimizer.zero_grad()
@@ -107,15 +186,128 @@ class DQNAgent:
 
             self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
 
+            if self.step_count % self.snapshot_interval == 0:
+                self._publish_snapshot()
+
             if self.step_count % self.save_interval == 0:
-                torch.save(self.q_net.state_dict(), self.model_path)
+                self.checkpoints.save(self.q_net, self.optimizer, epsilon=self.epsilon, step_count=self.step_count)
+                # Sync on-disk experience alongside the weights so a restart resumes with both
+                get_writer().submit(f'replay:{id(self.replay)}', self.replay.flush)
 
-    def get_metrics(self):
+    def get_checkpoint(self):
+        """CPU copy of everything restore() needs, including the target network, taken between train steps."""
         with self.lock:
             return {
+                'model': cpu_copy(self.q_net.state_dict()),
+                'target': cpu_copy(self.target_net.state_dict()),
+                'optimizer': cpu_copy(self.optimizer.state_dict()),
                 'epsilon': self.epsilon,
-                'step_count': self.step_count,
-                'replay_size': len(self.replay),
-                'last_loss': self.last_loss
+                'step_count': self.step_count
             }
-    
\ No newline at end of file
+
+    def fits(self, checkpoint) -> bool:
+        """Whether restore() would accept the checkpoint: its weights have this network's shapes."""
+        expected = {k: v.shape for k, v in self.q_net.state_dict().items()}
+        return {k: v.shape for k, v in checkpoint['model'].items()} == expected
+
+    def restore(self, checkpoint) -> bool:
+        """Load a full checkpoint from CheckpointManager.load_latest() or get_checkpoint(): weights, optimizer, epsilon and step count.
+
+        Returns False, leaving the agent as it was, if the checkpoint was saved for a different network shape.
+        """
+        with self.lock:
+            if not load_weights(self.q_net, checkpoint['model'], 'the checkpoint'):
+                return False
+            self.target_net.load_state_dict(checkpoint.get('target') or self.q_net.state_dict())
+            if checkpoint.get('optimizer') is not None:
+                self.optimizer.load_state_dict(checkpoint['optimizer'])
+            self.epsilon = checkpoint.get('epsilon', self.epsilon)
+            self.step_count = checkpoint.get('step_count', self.step_count)
+            self._publish_snapshot()
+            return True
+
+    def replay_memory_bytes(self):
+        return self.replay.memory_bytes()
+
+    def get_metrics(self):
+        # Plain attribute reads are atomic, so metrics don't need to wait on train()
+        return {
+            'epsilon': self.epsilon,
+            'step_count': self.step_count,
+            'replay_size': len(self.replay),
+            'last_loss': self.last_loss,
+            'snapshot_count': self.snapshot_count
+        }
+
+
+class InferenceAgent:
+    """Act-only agent for evaluation sessions.
+
+    Loads the trained weights and, where the quantized CPU backend is available,
+    applies dynamic int8 quantization to the Linear layers. No optimizer, target
+    network or replay buffer is allocated. Raises FileNotFoundError if there are
+    no weights and ValueError if they were saved for a different network shape.
+    """
+
+    def __init__(
+        self,
+        state_dim,
+        action_dim,
+        epsilon=0.05,
+        model_path=None,
+        initial_weights=None,
+        quantize=True
+    ):
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.epsilon = epsilon
+        self.model_path = model_path if model_path is not None else os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_FILE)
+
+        # Evaluating an untrained network would report meaningless scores, so missing or unfit weights are an error
+        net = build_q_net(state_dim, action_dim)
+        if initial_weights is not None:
+            state_dict, source = initial_weights, 'the shared pool'
+        elif os.path.exists(self.model_path):
+            state_dict, source = torch.load(self.model_path, weights_only=True), self.model_path
+        else:
+            raise FileNotFoundError(f"No model weights at {self.model_path} to evaluate")
+        try:
+            net.load_state_dict(state_dict)
+        except RuntimeError as e:
+            raise ValueError(f"Weights from {source} do not fit this network: {e}") from e
+        print(f"Model Loaded from {source}!")
+        net.eval()
+        net.requires_grad_(False)
+
+        self.quantized = False
+        if quantize:
+            try:
+                with warnings.catch_warnings():
+                    # torch.ao.quantization is deprecated in favour of torchao but still ships with torch
+                    warnings.simplefilter('ignore')
+                    net = torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+                self.quantized = True
+            except (AttributeError, RuntimeError) as e:
+                print(f"Quantization unavailable, using fp32 inference: {e}")
+        self.q_net = net
+
+    def act(self, state, mask=None):
+        if random.random() < self.epsilon:
+            return random_action(self.action_dim, mask)
+
+        # numpy converts a tuple of Python floats about twice as fast as torch.tensor does
+        state_tensor = torch.from_numpy(np.asarray(state, dtype=np.float32)).unsqueeze(0)
+        with torch.no_grad():
+            q_values = self.q_net(state_tensor)
+            if mask is not None:
+                q_values = masked_q(q_values, torch.from_numpy(np.asarray(mask, dtype=bool)).unsqueeze(0))
+            return q_values.argmax(dim=1).item()
+
+    def get_metrics(self):
+        return {
+            'epsilon': self.epsilon,
+            'step_count': 0,
+            'replay_size': 0,
+            'last_loss': 0.0,
+            'quantized': self.quantized
+        }
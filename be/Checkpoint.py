@@ -0,0 +1,207 @@
+import atexit
+import copy
+import glob
+import os
+import tempfile
+import threading
+import time
+
+import torch
+
+
+def atomic_save(obj, path: str):
+    """torch.save to a temp file in the target directory, then rename over the target.
+
+    Readers (and concurrent writers) only ever see a complete old file or a complete new one.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def cpu_copy(state):
+    """Detached CPU copy of a (possibly nested) state dict, safe to serialize while training continues."""
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {k: cpu_copy(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(cpu_copy(v) for v in state)
+    return copy.deepcopy(state)
+
+def shapes(state_dict) -> dict:
+    """Parameter name -> tensor shape, to tell whether two state_dicts belong to the same network."""
+    return {k: tuple(v.shape) for k, v in state_dict.items()}
+
+
+class CheckpointWriter:
+    """Single background thread that writes checkpoints for every manager in the process.
+
+    Jobs are keyed by target; a newer job for a target that hasn't been written yet
+    replaces the older one, so a slow disk makes checkpoints coarser instead of queuing up.
+    """
+
+    def __init__(self):
+        self.pending: dict[str, callable] = {}
+        self.busy = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, key: str, job) -> bool:
+        """Queue a job. Returns False if it replaced an unwritten job for the same key."""
+        with self.cond:
+            replaced = key in self.pending
+            self.pending.pop(key, None)
+            self.pending[key] = job
+            self.cond.notify_all()
+        return not replaced
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every queued checkpoint has been written."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.busy, timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending)
+                key = next(iter(self.pending))
+                job = self.pending.pop(key)
+                self.busy = True
+
+            try:
+                job()
+            except Exception as e:
+                print(f"Checkpoint write failed for {key}: {e}")
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> CheckpointWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CheckpointWriter()
+        return _writer
+
+
+class CheckpointManager:
+    """Asynchronous, atomic model checkpoints with versioned snapshots.
+
+    save() only copies the weights (and optionally optimizer state) to CPU on the
+    caller's thread; serialization happens on the background writer. The model
+    file keeps the plain state_dict format DQNAgent has always loaded, while
+    every `version_every`-th save also writes a full checkpoint (weights,
+    optimizer, epsilon, step count) into `versions_dir`, keeping the newest `keep`.
+
+    A model file saved for a different network shape is never overwritten: the
+    first write checks it, and if the shapes differ every save to it is refused.
+    """
+
+    def __init__(self, model_path: str, versions_dir: str | None = None, keep: int = 5, version_every: int = 10):
+        self.model_path = model_path
+        self.versions_dir = versions_dir if versions_dir is not None else os.path.join(os.path.dirname(model_path), 'checkpoints')
+        self.keep = keep
+        self.version_every = version_every
+        self.stem = os.path.splitext(os.path.basename(model_path))[0]
+
+        self.requested = 0
+        self.save_count = 0
+        self.skipped = 0
+        self.target_checked = False
+        self.refused: str | None = None
+        self.last_copy_seconds = 0.0
+        self.copy_seconds_total = 0.0
+        self.last_write_seconds = 0.0
+        self.write_seconds_total = 0.0
+
+    def save(self, model, optimizer=None, **extra):
+        """Snapshot the model now and write it in the background. Extra keyword values go into versioned checkpoints."""
+        copy_start = time.perf_counter()
+        model_state = cpu_copy(model.state_dict())
+        self.requested += 1
+        versioned = self.version_every > 0 and self.requested % self.version_every == 0
+        checkpoint = None
+        if versioned:
+            checkpoint = {
+                'model': model_state,
+                'optimizer': cpu_copy(optimizer.state_dict()) if optimizer is not None else None,
+                **extra
+            }
+        self.last_copy_seconds = time.perf_counter() - copy_start
+        self.copy_seconds_total += self.last_copy_seconds
+
+        writer = get_writer()
+        if not writer.submit(self.model_path, lambda: self._write(model_state)):
+            self.skipped += 1
+        if checkpoint is not None:
+            version_path = os.path.join(self.versions_dir, f'{self.stem}_{int(time.time() * 1000)}_{extra.get("step_count", self.requested):08d}.pth')
+            writer.submit(version_path, lambda: self._write_version(checkpoint, version_path))
+
+    def _write(self, model_state):
+        if not self.target_checked:
+            self.target_checked = True
+            if os.path.exists(self.model_path):
+                existing = shapes(torch.load(self.model_path, map_location='cpu', weights_only=True))
+                if existing != shapes(model_state):
+                    self.refused = f"{self.model_path} holds weights for a different network shape"
+                    print(f"Not checkpointing over {self.model_path}: it holds weights for a different network shape")
+        if self.refused is not None:
+            return
+
+        write_start = time.perf_counter()
+        atomic_save(model_state, self.model_path)
+        self.last_write_seconds = time.perf_counter() - write_start
+        self.write_seconds_total += self.last_write_seconds
+        self.save_count += 1
+
+    def _write_version(self, checkpoint, version_path):
+        atomic_save(checkpoint, version_path)
+
+        versions = self.versions()
+        for old in versions[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def versions(self) -> list[str]:
+        """Versioned checkpoint paths, oldest first."""
+        paths = glob.glob(os.path.join(self.versions_dir, f'{self.stem}_*.pth'))
+        return sorted(paths, key=os.path.getmtime)
+
+    def load_latest(self, map_location='cpu') -> dict | None:
+        """The newest versioned checkpoint, or None if there isn't one."""
+        versions = self.versions()
+        if not versions:
+            return None
+        return torch.load(versions[-1], map_location=map_location, weights_only=True)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return get_writer().flush(timeout)
+
+    def get_metrics(self):
+        return {
+            'save_count': self.save_count,
+            'skipped': self.skipped,
+            'refused': self.refused,
+            'last_copy_seconds': self.last_copy_seconds,
+            'copy_seconds_total': self.copy_seconds_total,
+            'last_write_seconds': self.last_write_seconds,
+            'write_seconds_total': self.write_seconds_total
+        }
@@ -4,13 +4,30 @@ from Node import Node
 from Location import RoadPriority
 
 class Edge:
-    def __init__(self, start: Node, end: Node, oneway: bool = True, priority: RoadPriority = RoadPriority.UNCLASSIFIED):
+    def __init__(self, start: Node, end: Node, oneway: bool = True, priority: RoadPriority = RoadPriority.UNCLASSIFIED, path: list[Node] | None = None):
         self.start = start
         self.end = end
-        self.oneway = False
+        # Interior points of a contracted road (see contract_chains); empty for a single street segment
+        self.path: tuple[Node, ...] = tuple(path) if path else ()
+        # One-way edges can only be driven from start to end; two-way edges stand for both directions of the street
+        self.oneway = oneway
         self.priority = priority
-        self.clean = False
-        self.length: float = math.sqrt(math.pow(end.x - start.x, 2)) + math.sqrt(math.pow(end.y - start.y, 2))
+        # Graphs holding this edge; their clean_version moves whenever clean changes
+        self.graphs: list = []
+        self._clean = False
+        points = (start, *self.path, end)
+        self.length: float = sum(math.sqrt(math.pow(b.x - a.x, 2)) + math.sqrt(math.pow(b.y - a.y, 2)) for a, b in zip(points, points[1:]))
+
+    @property
+    def clean(self) -> bool:
+        return self._clean
+
+    @clean.setter
+    def clean(self, value: bool):
+        if value != self._clean:
+            self._clean = value
+            for graph in self.graphs:
+                graph.clean_version += 1
 
     def vectorize(self) -> tuple[float, float, float, float, float, float]:
         return (self.start.x, self.start.y, self.end.x, self.end.y, float(self.priority.value), 1 if self.clean else 0)
@@ -21,7 +38,8 @@ class Edge:
         return False
 
     def __hash__(self):
-        return hash((self.start, self.end))
+        # Symmetric like __eq__, so the two directions of a street are one edge in a set
+        return hash(self.start) ^ hash(self.end)
 
     def __str__(self):
         return f'{{{self.start}, {self.end})}}'
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""Headless batch evaluation of trained models (and the route planner) across many maps.
+
+Runs World + policy flat out: no socket, no sleeps, no serialization, one process per map.
+
+    python Evaluate.py --cache api/cache/*.json.gz --synthetic city:2500 --model model_eval_y50_a8.pth --planner
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+from World import World
+from Location import Location, CachedLocation
+from SubGraph import SubGraphEdge, MODEL_FILE
+from Policy import check_policy, make_policy
+
+
+def load_location(map_spec: tuple):
+    kind, value = map_spec
+    if kind == 'bounds':
+        return Location(bounds=value)
+    if kind == 'cache':
+        with (gzip.open if value.endswith('.gz') else open)(value, 'rt') as f:
+            return CachedLocation(json.load(f))
+    if kind == 'synthetic':
+        from benchmarks.synthetic import GENERATORS
+        graph_kind, num_nodes = value
+        return GENERATORS[graph_kind](num_nodes)
+    raise ValueError(f"Unknown map kind: {kind}")
+
+def evaluate_map(task: dict) -> dict:
+    # World and the agent log with print; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        return run_map(task)
+
+def run_map(task: dict) -> dict:
+    random.seed(task['seed'])
+    result = {'map': task['name'], 'policy': task['policy']}
+
+    load_start = time.perf_counter()
+    location = load_location(task['map'])
+    world = World(location, task['num_workers'], getattr(location, 'node_groups', None), contract=task['contract'])
+    result['load_seconds'] = time.perf_counter() - load_start
+    result['edges'] = len(world.graph.edges)
+
+    act = make_policy(task['policy'], world, task['epsilon'], task['quantize'])
+
+    steps = 0
+    actions = 0
+    overlaps = 0
+    invalid = 0
+    idle = 0
+    started = time.perf_counter()
+
+    while not world.is_finished() and steps < task['max_steps']:
+        moved = False
+        for worker in world.workers:
+            action = act(worker)
+            if action is None:
+                # The planner returns None once a worker has nothing left to clean; that isn't a bad move
+                if task['policy'] == 'planner':
+                    idle += 1
+                    continue
+                invalid += 1
+            else:
+                edge = action[1].edge if isinstance(action[1], SubGraphEdge) else action[1]
+                overlaps += edge.clean
+
+            worker.state, _, _ = worker.apply_action(action)
+            actions += 1
+            moved = True
+
+        steps += 1
+        # Only the planner can run out of moves; a DQN policy keeps acting until max_steps
+        if not moved:
+            break
+
+    wall_seconds = time.perf_counter() - started
+    finished = world.is_finished()
+    result.update({
+        'finished': finished,
+        'steps_to_clear': steps if finished else None,
+        'steps': steps,
+        'actions': actions,
+        'overlap': overlaps,
+        'invalid_actions': invalid,
+        'idle_actions': idle,
+        'clean_ratio': world.graph.clean_ratio(),
+        'wall_seconds': wall_seconds,
+        'steps_per_second': steps / wall_seconds if wall_seconds > 0 else 0.0,
+    })
+    return result
+
+def parse_maps(args) -> list[tuple[str, tuple]]:
+    maps = []
+    for bounds in args.bounds or []:
+        values = [float(b) for b in bounds.split(',')]
+        if len(values) != 4:
+            raise ValueError(f"Invalid bounds {bounds}. Expected min_lat,max_lat,min_lon,max_lon")
+        maps.append((f'bounds:{bounds}', ('bounds', values)))
+    for path in args.cache or []:
+        maps.append((os.path.basename(path), ('cache', path)))
+    for spec in args.synthetic or []:
+        kind, _, num_nodes = spec.partition(':')
+        maps.append((f'synthetic:{spec}', ('synthetic', (kind, int(num_nodes or 2500)))))
+    return maps
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate policies on many maps without the server or viewer.')
+    parser.add_argument('--bounds', action='append', help='min_lat,max_lat,min_lon,max_lon (fetched with OSMnx)')
+    parser.add_argument('--cache', nargs='+', help='cached graph files from api/cache (.json or .json.gz)')
+    parser.add_argument('--synthetic', action='append', help='synthetic graph as kind:nodes, e.g. city:2500')
+    parser.add_argument('--model', action='append', help=f'model weights to evaluate (default: {MODEL_FILE})')
+    parser.add_argument('--planner', action='store_true', help='also evaluate the route-inspection planner baseline')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--contract', action='store_true', help='merge chains of degree-2 nodes into single roads')
+    parser.add_argument('--max-steps', type=int, default=10_000)
+    parser.add_argument('--epsilon', type=float, default=0.05)
+    parser.add_argument('--no-quantize', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    maps = parse_maps(args)
+    if not maps:
+        parser.error('No maps given. Use --bounds, --cache or --synthetic.')
+
+    policies = [os.path.abspath(m) for m in args.model or [os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_FILE)]]
+    if args.planner:
+        policies.append('planner')
+
+    for policy in policies:
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                check_policy(policy)
+        except (FileNotFoundError, ValueError) as e:
+            parser.error(f'Cannot evaluate {policy}: {e}')
+
+    # Every policy sees the same seed per map, so worker spawns match across models
+    tasks = [
+        {
+            'name': name, 'map': map_spec, 'policy': policy, 'seed': args.seed + i,
+            'num_workers': args.workers, 'max_steps': args.max_steps,
+            'epsilon': args.epsilon, 'quantize': not args.no_quantize, 'contract': args.contract
+        }
+        for i, (name, map_spec) in enumerate(maps)
+        for policy in policies
+    ]
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=min(args.processes, len(tasks))) as pool:
+        for result in pool.map(evaluate_map, tasks):
+            print(f"{result['map']} [{os.path.basename(result['policy'])}]: steps={result['steps']} clean={result['clean_ratio']:.3f} overlap={result['overlap']} wall={result['wall_seconds']:.2f}s", file=sys.stderr)
+            results.append(result)
+
+    report = {'results': results, 'wall_seconds': time.perf_counter() - started}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
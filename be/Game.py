@@ -1,25 +1,37 @@
 import pygame
-from World import World, Node, Edge, Location, Worker
-from SubGraph import SubGraphEdge
+from World import World, Node, Edge, Worker
 from Location import RoadPriority
 import time, random
 
-pygame.init()
-screen = pygame.display.set_mode((1280, 720))
-clock = pygame.time.Clock()
-running = True
-dt = 0
+# Frames per second the viewer draws at most; update() returns immediately between frames
+FPS = 60
+# The map is bucketed into GRID_CELLS x GRID_CELLS cells so only visible roads are projected and drawn
+GRID_CELLS = 64
 
 class Game:
+    """pygame viewer. Either call update() between simulation steps, or give the main thread to run()
+    while the simulation steps in another thread and hands over each new world with show()."""
+
     def __init__(self, world: World | None):
+        # The display is only opened once a viewer is actually created, so importing this module stays headless
+        pygame.init()
+        self.screen = pygame.display.set_mode((1280, 720))
+        self.dt = 0
+        self.open = True
+
         self.offset = (0.0, 0.0)
         self.offset_amount = 35
         self.scale = 1.0
-        self.world = world
+        self.world = None
+        # The world show() asked for; update() switches to it on the render thread
+        self.requested = world
+        self.last_frame = time.perf_counter()
+        if world is not None:
+            self.reset(world)
 
     def grid_to_screen(self, node: Node) -> tuple[float, float]:
-        relative_pos = self.world.graph.relative_position(node)
-        return (((relative_pos[0]) * screen.get_width() * self.scale) - (self.offset[0] * self.scale), ((1 - relative_pos[1]) * screen.get_height() * self.scale) - (self.offset[1] * self.scale))
+        relative_pos = self.relative.get(node) or self.world.graph.relative_position(node)
+        return (((relative_pos[0]) * self.screen.get_width() * self.scale) - (self.offset[0] * self.scale), ((1 - relative_pos[1]) * self.screen.get_height() * self.scale) - (self.offset[1] * self.scale))
 
     def priorty_color(self, priorty: RoadPriority) -> str:
         match priorty:
@@ -40,58 +52,144 @@ class Game:
             case RoadPriority.UNCLASSIFIED:
                 return '#D3D3D3'
 
-    def node_in_scale_range(self, node: Node) -> bool:
-        relative_pos = self.world.graph.relative_position(node)
-        return (self.offset[0] / screen.get_width()) <= relative_pos[0] <= (self.offset[0] / screen.get_width()) + (1 / self.scale) and (self.offset[1] / screen.get_height()) <= 1 - relative_pos[1] <= (self.offset[1] / screen.get_height()) + (1 / self.scale)
-
-    def draw_node(self, node: Node):
-        if self.node_in_scale_range(node):
-            pygame.draw.circle(screen, "blue", self.grid_to_screen(node), 1.5)
-
     def reset(self, world: World):
+        self.requested = world
+        self._load(world)
+
+    def _load(self, world: World):
         self.world = world
         self.color_dict = self.sub_graph_color_dict(self.world)
         self.scale = 1
         self.offset = (0, 0)
-
-    def draw_edge(self, edge: Edge, color: tuple[float, float, float] | str):
-        if self.node_in_scale_range(edge.start) or self.node_in_scale_range(edge.end):
-            # final_color = priorty_color(edge.priority) if not edge.clean else "green"
-            final_color = color if not edge.clean else "green"
-            size = 1 if edge.oneway else 2
-            pygame.draw.line(screen, final_color, self.grid_to_screen(edge.start), self.grid_to_screen(edge.end), size)
-
-    def draw_sub_graph_edge(self, edge: SubGraphEdge):
-        self.draw_edge(edge.edge, "black")
-
-    def draw_worker(self, worker: Worker):
-        if self.node_in_scale_range(worker.position):
-            pygame.draw.circle(screen, "red", self.grid_to_screen(worker.position), 3)
-
-    def draw_world(self, world: World):
-        for sub_graph in world.sub_graphs:
+        self.build_index()
+
+    def build_index(self):
+        """Project every node to relative coordinates once and bucket roads and nodes into grid cells."""
+        graph = self.world.graph
+        self.relative: dict[Node, tuple[float, float]] = {n: graph.relative_position(n) for n in graph.nodes}
+        # Interior points of contracted roads
+        self.relative.update((n, graph.relative_position(n)) for e in graph.edges for n in e.path)
+
+        # (edge, color, width) per road; boundary edges are drawn in black like before
+        self.items: list[tuple[Edge, tuple[float, float, float] | str, int]] = []
+        self.nodes: list[Node] = []
+        for sub_graph in self.world.sub_graphs:
             color = self.color_dict[sub_graph.id]
-            for e in sub_graph.edges:
-                self.draw_edge(e, color)
-            for e in sub_graph.sub_graph_edges:
-                self.draw_sub_graph_edge(e)
-            for n in sub_graph.nodes:
-                self.draw_node(n)
-        
-        for worker in world.workers:
-            self.draw_worker(worker)
+            self.items.extend((e, color, 1 if e.oneway else 2) for e in sub_graph.edges)
+            self.items.extend((e.edge, "black", 1 if e.edge.oneway else 2) for e in sub_graph.sub_graph_edges)
+            self.nodes.extend(sub_graph.nodes)
+
+        self.edge_cells: dict[tuple[int, int], list[int]] = {}
+        for i, (edge, _, _) in enumerate(self.items):
+            for cell in {self.cell(n) for n in (edge.start, *edge.path, edge.end)}:
+                self.edge_cells.setdefault(cell, []).append(i)
+        self.node_cells: dict[tuple[int, int], list[Node]] = {}
+        for node in self.nodes:
+            self.node_cells.setdefault(self.cell(node), []).append(node)
+
+        self.view = None
+        self.background = None
+        self.worker_rects: list[pygame.Rect] = []
+
+    def cell(self, node: Node) -> tuple[int, int]:
+        rx, ry = self.relative[node]
+        return (min(int(rx * GRID_CELLS), GRID_CELLS - 1), min(int((1 - ry) * GRID_CELLS), GRID_CELLS - 1))
+
+    def visible_cells(self) -> list[tuple[int, int]]:
+        # The viewport in relative coordinates (y measured down from the top, as on screen)
+        left = self.offset[0] / self.screen.get_width()
+        top = self.offset[1] / self.screen.get_height()
+        span = 1 / self.scale
+        x0, x1 = max(0, int(left * GRID_CELLS)), min(GRID_CELLS - 1, int((left + span) * GRID_CELLS))
+        y0, y1 = max(0, int(top * GRID_CELLS)), min(GRID_CELLS - 1, int((top + span) * GRID_CELLS))
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def draw_worker(self, worker: Worker) -> pygame.Rect:
+        point = self.projected.get(worker.position) or self.grid_to_screen(worker.position)
+        return pygame.draw.circle(self.screen, "red", point, 3)
+
+    def render_background(self):
+        """Draw the visible roads and nodes for the current zoom/offset onto a cached surface."""
+        self.background = pygame.Surface(self.screen.get_size())
+        self.background.fill("white")
+
+        width, height = self.screen.get_size()
+        def on_screen(point):
+            return 0 <= point[0] <= width and 0 <= point[1] <= height
+
+        cells = self.visible_cells()
+        # Projected once per zoom/offset; frames in between only look these up
+        self.projected: dict[Node, tuple[float, float]] = {}
+        def project(node):
+            point = self.projected.get(node)
+            if point is None:
+                point = self.projected[node] = self.grid_to_screen(node)
+            return point
+
+        # (edge, color, width, points from start to end) for every road on screen
+        self.visible: list[tuple[Edge, tuple[float, float, float] | str, int, list[tuple[float, float]]]] = []
+        self.drawn_clean: list[bool] = []
+        for i in sorted({i for cell in cells for i in self.edge_cells.get(cell, ())}):
+            edge, color, size = self.items[i]
+            points = [project(n) for n in (edge.start, *edge.path, edge.end)]
+            if any(on_screen(point) for point in points):
+                pygame.draw.lines(self.background, color if not edge.clean else "green", False, points, size)
+                self.visible.append((edge, color, size, points))
+                self.drawn_clean.append(edge.clean)
+
+        for cell in cells:
+            for node in self.node_cells.get(cell, ()):
+                point = project(node)
+                if on_screen(point):
+                    pygame.draw.circle(self.background, "blue", point, 1.5)
+
+        self.view = (self.scale, self.offset, self.screen.get_size())
+
+    def draw_world(self, world: World) -> list[pygame.Rect] | None:
+        """Bring the screen up to date. Returns the dirty rectangles, or None if the whole screen was redrawn."""
+        full = self.background is None or self.view != (self.scale, self.offset, self.screen.get_size())
+        if full:
+            self.render_background()
+
+        # Only roads whose clean state changed since they were drawn are redrawn
+        dirty: list[pygame.Rect] = []
+        for i, (edge, color, size, points) in enumerate(self.visible):
+            if edge.clean != self.drawn_clean[i]:
+                rect = pygame.draw.lines(self.background, color if not edge.clean else "green", False, points, size)
+                for point in (points[0], points[-1]):
+                    pygame.draw.circle(self.background, "blue", point, 1.5)
+                self.drawn_clean[i] = edge.clean
+                dirty.append(rect.inflate(4, 4))
+
+        if full:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.worker_rects + dirty:
+                self.screen.blit(self.background, rect, rect)
+
+        previous = self.worker_rects
+        self.worker_rects = [self.draw_worker(worker).inflate(2, 2) for worker in world.workers]
+        return None if full else dirty + previous + self.worker_rects
 
     def sub_graph_color_dict(self, world: World) -> dict[int, tuple[float, float, float]]:
         colors = {}
         for sub_graph in world.sub_graphs:
             colors[sub_graph.id] = (random.random() * 255, random.random() * 255, random.random() * 255)
-        
+
         return colors
 
     def update(self):
+        """Draw a frame if one is due. Cheap to call after every simulation step: it never sleeps or blocks."""
+        now = time.perf_counter()
+        if now - self.last_frame < 1 / FPS:
+            return
+        self.dt = now - self.last_frame
+        self.last_frame = now
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.quit()
+                return
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_p:
                     self.scale *= 2
@@ -108,15 +206,35 @@ class Game:
                 elif event.key == pygame.K_DOWN:
                     self.offset = (self.offset[0], self.offset[1] + self.offset_amount)
 
-        screen.fill("white")
+        requested = self.requested
+        if requested is not self.world:
+            self._load(requested)
+
+        if self.world is None:
+            self.screen.fill("white")
+            pygame.display.flip()
+            return
+
+        dirty = self.draw_world(self.world)
+        pygame.display.set_caption(f'Clean: %{self.world.graph.clean_ratio() * 100}')
+
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+
+    def show(self, world: World):
+        """Switch to a new world from any thread; the next frame rebuilds the index for it."""
+        self.requested = world
 
-        if self.world is not None:
-            self.draw_world(self.world)
-            
-            pygame.display.set_caption(f'Clean: %{self.world.graph.clean_ratio() * 100}')
+    def run(self, keep_running):
+        """Draw at FPS on the calling thread, independent of how fast the simulation steps, until
+        keep_running() is false or the window is closed."""
+        while self.open and keep_running():
+            self.update()
+            time.sleep(max(0.0, self.last_frame + 1 / FPS - time.perf_counter()))
 
-        pygame.display.flip()
-        dt = clock.tick(60) / 1000
-    
     def quit(self):
-        pygame.quit()
+        if self.open:
+            self.open = False
+            pygame.quit()
@@ -16,8 +16,15 @@ class Graph:
         self.most_down = float('inf')
         self.most_up = float('-inf')
 
+        # Bumped whenever one of the edges changes clean state, or a worker on this graph moves,
+        # so observations built from them can be reused until then
+        self.clean_version = 0
+        self.position_version = 0
+
     def add_edge(self, edge: Edge):
-        self.edges.add(edge)
+        if edge not in self.edges:
+            self.edges.add(edge)
+            edge.graphs.append(self)
         self.add_node(edge.start)
         self.add_node(edge.end)
     
@@ -87,7 +94,9 @@ class Graph:
                     'length': edge.length,
                     'clean': edge.clean,
                     'priority': edge.priority.value,
-                    'oneway': edge.oneway
+                    'oneway': edge.oneway,
+                    # Contracted roads also carry the points between their ends, for drawing
+                    **({'path': [{'x': n.x, 'y': n.y} for n in edge.path]} if edge.path else {})
                 }
                 for edge in self.edges
             ],
@@ -1,12 +1,15 @@
-import osmnx as ox
-from matplotlib import pyplot as plt
 from typing import Union
-
-# ox.settings.max_query_area_size = 25 * 1000 * 1000
-ox.settings.use_cache = True
-ox.settings.log_console = False
 from enum import Enum
 
+def load_osmnx():
+    """Import and configure osmnx on first use; it pulls in geopandas/shapely and is slow to import."""
+    import osmnx as ox
+
+    # ox.settings.max_query_area_size = 25 * 1000 * 1000
+    ox.settings.use_cache = True
+    ox.settings.log_console = False
+    return ox
+
 # ox.settings.max_query_area_size = 50 * 1000 * 1000  # 50 km² in square meters
 class RoadPriority(Enum):
     MOTORWAY_LINK = 0
@@ -18,8 +21,163 @@ class RoadPriority(Enum):
     RESIDENTIAL = 5
     UNCLASSIFIED = 6
 
+def merge_reverse_edges(edges: list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]) -> list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]:
+    """One edge per street from directed (start, end, oneway, priority) tuples.
+
+    OSMnx lists a two-way street once per direction; those pairs (and parallel
+    duplicates) become a single two-way edge. A street listed in one direction
+    keeps its oneway flag, pointing from start to end. One-way streets that
+    leave a strongly connected part of the network for good (usually cut off by
+    the bounding box) are made two-way, so workers can't be stranded.
+    """
+    directed: dict[tuple[tuple[float, float], tuple[float, float]], tuple[bool, RoadPriority]] = {}
+    for start, end, oneway, priority in edges:
+        directed.setdefault((start, end), (oneway, priority))
+
+    merged = []
+    for (start, end), (oneway, priority) in directed.items():
+        if (end, start) in directed:
+            # Keep one direction of the pair, chosen by coordinates so rebuilds agree on it
+            if (start, end) < (end, start) or start == end:
+                merged.append((start, end, False, priority))
+        else:
+            merged.append((start, end, oneway, priority))
+
+    component = strongly_connected_components(merged)
+    return [(start, end, oneway and component[start] == component[end], priority) for start, end, oneway, priority in merged]
+
+def strongly_connected_components(edges: list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]) -> dict[tuple[float, float], int]:
+    """Component id per node of the directed street graph (Kosaraju, iterative)."""
+    forward: dict[tuple[float, float], list[tuple[float, float]]] = {}
+    backward: dict[tuple[float, float], list[tuple[float, float]]] = {}
+    for start, end, oneway, _ in edges:
+        forward.setdefault(start, []).append(end)
+        backward.setdefault(end, []).append(start)
+        forward.setdefault(end, [])
+        backward.setdefault(start, [])
+        if not oneway:
+            forward[end].append(start)
+            backward[start].append(end)
+
+    # Nodes in order of DFS completion
+    order = []
+    visited = set()
+    for root in forward:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, iter(forward[root]))]
+        while stack:
+            node, neighbours = stack[-1]
+            for next_node in neighbours:
+                if next_node not in visited:
+                    visited.add(next_node)
+                    stack.append((next_node, iter(forward[next_node])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+
+    component: dict[tuple[float, float], int] = {}
+    for root in reversed(order):
+        if root in component:
+            continue
+        component[root] = root_id = len(component)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for next_node in backward[node]:
+                if next_node not in component:
+                    component[next_node] = root_id
+                    stack.append(next_node)
+    return component
+
+def contract_chains(edges: list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]) -> list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority, list[tuple[float, float]]]]:
+    """Merge runs of streets through degree-2 nodes into one (start, end, oneway, priority, path) road per run.
+
+    Expects merge_reverse_edges() output. A node is only passed through if both of its
+    streets are two-way or both are one-way in the same direction of travel. `path` holds
+    the interior points in order and a road takes the most important priority along it.
+    Runs that would duplicate another road between the same two nodes are split at an
+    interior point, since Edge treats edges with the same ends as equal.
+    """
+    incident: dict[tuple[float, float], list[int]] = {}
+    for i, (start, end, _, _) in enumerate(edges):
+        incident.setdefault(start, []).append(i)
+        if end != start:
+            incident.setdefault(end, []).append(i)
+
+    def other(i, node):
+        start, end, _, _ = edges[i]
+        return end if node == start else start
+
+    def passes_through(node):
+        if len(incident[node]) != 2:
+            return False
+        a, b = (edges[i] for i in incident[node])
+        if a[0] == a[1] or b[0] == b[1] or other(incident[node][0], node) == other(incident[node][1], node):
+            return False
+        if not a[2] and not b[2]:
+            return True
+        # One-way through traffic: one street arrives at the node and the other leaves it
+        return a[2] and b[2] and (a[1] == node) != (b[1] == node)
+
+    through = {node for node in incident if passes_through(node)}
+    used = [False] * len(edges)
+    runs = []
+    roads = []
+    taken: set[frozenset] = set()
+
+    def emit(start, end, oneway, priority, path):
+        key = frozenset((start, end))
+        if key in taken and path:
+            # Biased to the front so a closed loop's second half keeps a point to split at again
+            mid = (len(path) - 1) // 2
+            emit(start, path[mid], oneway, priority, path[:mid])
+            emit(path[mid], end, oneway, priority, path[mid + 1:])
+            return
+        taken.add(key)
+        roads.append((start, end, oneway, priority, path))
+
+    def walk(origin, first):
+        node, i, path, chain = origin, first, [], []
+        while True:
+            used[i] = True
+            chain.append(i)
+            node = other(i, node)
+            if node not in through or node == origin:
+                break
+            path.append(node)
+            i = next(j for j in incident[node] if j != i)
+
+        oneway = edges[first][2]
+        priority = RoadPriority(min(edges[j][3].value for j in chain))
+        if oneway and edges[first][0] != origin:
+            # Travel runs towards origin
+            runs.append((node, origin, True, priority, path[::-1]))
+        else:
+            runs.append((origin, node, oneway, priority, path))
+
+    for node, edge_ids in incident.items():
+        if node in through:
+            continue
+        for i in edge_ids:
+            if not used[i]:
+                walk(node, i)
+
+    # Whatever is left forms closed loops of degree-2 nodes; each becomes a road from and back to one of its nodes
+    for i, (start, _, _, _) in enumerate(edges):
+        if not used[i]:
+            walk(start, i)
+
+    # Single streets claim their ends first; only runs with interior points can be split to make way
+    for run in sorted(runs, key=lambda run: len(run[4]) > 0):
+        emit(*run)
+    return roads
+
 class Location:
     def __init__(self, place: Union[str, list] = None, bounds: list = None):
+        ox = load_osmnx()
         if bounds is not None:
             min_lat, max_lat, min_lon, max_lon = bounds
             bbox = (min_lon, min_lat, max_lon, max_lat)
@@ -64,6 +222,11 @@ class Location:
         return graph_edges
     
     def plot_location(self):
+        try:
+            from matplotlib import pyplot as plt
+        except ImportError:
+            raise ImportError("plot_location requires matplotlib (pip install matplotlib)")
+
         edges = self.get_edges()
 
         for edge in edges:
@@ -95,4 +258,34 @@ class Location:
             case 'unclassified':
                 return RoadPriority.UNCLASSIFIED
             case _:
-                return RoadPriority.UNCLASSIFIED
\ No newline at end of file
+                return RoadPriority.UNCLASSIFIED
+
+class CachedLocation:
+    """Location rebuilt from a Graph.to_dict() payload (e.g. a server cache entry), without touching OSMnx."""
+
+    def __init__(self, graph_dict: dict):
+        bounds = graph_dict['bounds']
+        self.most_left  = bounds['left']
+        self.most_down  = bounds['down']
+        self.most_right = bounds['right']
+        self.most_up    = bounds['up']
+
+        self.edges = [
+            ((e['start']['x'], e['start']['y']), (e['end']['x'], e['end']['y']), e['oneway'], RoadPriority(e['priority']))
+            for e in graph_dict['edges']
+        ]
+
+        # Payloads from World.to_dict() carry their sub graph partition; pass it to World(node_groups=...)
+        self.node_groups: list[list[tuple[float, float]]] | None = None
+        if 'sub_graphs' in graph_dict:
+            groups: dict[int, list[tuple[float, float]]] = {}
+            for node, sub_graph_id in zip(graph_dict['nodes'], graph_dict['sub_graphs']):
+                if sub_graph_id >= 0:
+                    groups.setdefault(sub_graph_id, []).append((node['x'], node['y']))
+            self.node_groups = [groups.get(i, []) for i in range(max(groups, default=-1) + 1)]
+
+    def get_cache_name(self):
+        return Location.get_cache_name(self)
+
+    def get_edges(self) -> list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]:
+        return self.edges
@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import time
+
+from SubGraph import Node, Edge, SubGraph, SubGraphEdge
+
+# Multiplier applied per RoadPriority step when scoring a target edge.
+# Motorways (0) are scored at their path cost, residential roads (5) at 2.25x,
+# so important roads are cleared first unless they are much further away.
+PRIORITY_BIAS = 0.25
+
+class RoutePlanner:
+    """Deterministic route-inspection planner used as a non-RL baseline.
+
+    Each worker keeps a tour over its home sub graph: it repeatedly walks the
+    shortest path to the best-scoring uncleaned edge (path cost weighted by
+    RoadPriority) and cleans it. Once its home sub graph is done it helps out
+    anywhere in the graph. Targets are claimed so workers do not race for the
+    same edge.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.adjacency: dict[Node, list[tuple[Node, Edge | SubGraphEdge]]] = build_adjacency(world.sub_graphs)
+        self.home_edges: dict[int, set[Edge]] = {w.id: home_edges(w.sub_graph) for w in world.workers}
+        self.plans: dict[int, list[tuple[Node, Edge | SubGraphEdge]]] = {}
+        self.targets: dict[int, Edge] = {}
+        self.claimed: dict[Edge, int] = {}
+        self.idle: set[int] = set()
+        self.home_done: set[int] = set()
+
+        self.planning_time = 0.0
+        self.replans = 0
+
+    def next_action(self, worker) -> tuple[Node, Edge | SubGraphEdge] | None:
+        """Next (node, edge) action for the worker, or None once nothing reachable is left."""
+        target = self.targets.get(worker.id)
+        if target is None or target.clean or not self.plans.get(worker.id):
+            self._replan(worker)
+
+        plan = self.plans.get(worker.id)
+        if not plan:
+            return None
+        return plan.pop()
+
+    def forget(self, worker):
+        """Drop the worker's plan and claim, e.g. after it was moved by something other than this planner."""
+        self.plans.pop(worker.id, None)
+        target = self.targets.pop(worker.id, None)
+        if target is not None and self.claimed.get(target) == worker.id:
+            del self.claimed[target]
+        self.idle.discard(worker.id)
+
+    def is_exhausted(self) -> bool:
+        return len(self.idle) == len(self.world.workers)
+
+    def _replan(self, worker):
+        started = time.perf_counter()
+        self.replans += 1
+
+        old_target = self.targets.pop(worker.id, None)
+        if old_target is not None and self.claimed.get(old_target) == worker.id:
+            del self.claimed[old_target]
+
+        plan = None
+        if worker.id not in self.home_done:
+            home = self.home_edges[worker.id]
+            plan = self._plan_to_target(worker, lambda e: e in home)
+            if plan is None:
+                self.home_done.add(worker.id)
+        if plan is None:
+            plan = self._plan_to_target(worker, lambda e: True)
+
+        if plan is None:
+            self.plans[worker.id] = []
+            self.idle.add(worker.id)
+        else:
+            target, steps = plan
+            self.plans[worker.id] = steps
+            self.targets[worker.id] = target
+            self.claimed[target] = worker.id
+            self.idle.discard(worker.id)
+
+        self.planning_time += time.perf_counter() - started
+
+    def _plan_to_target(self, worker, accept) -> tuple[Edge, list[tuple[Node, Edge | SubGraphEdge]]] | None:
+        """Dijkstra from the worker's position to the best uncleaned edge accepted by `accept`.
+
+        Returns the target edge and the actions to reach and clean it, stored in
+        reverse so the next action can be popped off the end.
+        """
+        counter = itertools.count()
+        dist: dict[Node, float] = {worker.position: 0.0}
+        came_from: dict[Node, tuple[Node, Edge | SubGraphEdge]] = {}
+        queue = [(0.0, next(counter), worker.position)]
+
+        best_score = float('inf')
+        best: tuple[Node, tuple[Node, Edge | SubGraphEdge]] | None = None
+
+        while queue:
+            d, _, node = heapq.heappop(queue)
+            if d > dist.get(node, float('inf')):
+                continue
+            # Scores are never below the path cost, so nothing further away can win.
+            if d >= best_score:
+                break
+
+            for neighbour, action_edge in self.adjacency.get(node, ()):
+                edge = underlying_edge(action_edge)
+
+                if not edge.clean and self.claimed.get(edge, worker.id) == worker.id and accept(edge):
+                    score = (d + edge.length) * (1 + PRIORITY_BIAS * edge.priority.value)
+                    if score < best_score:
+                        best_score = score
+                        best = (node, (neighbour, action_edge))
+
+                nd = d + edge.length
+                if nd < dist.get(neighbour, float('inf')):
+                    dist[neighbour] = nd
+                    came_from[neighbour] = (node, (neighbour, action_edge))
+                    heapq.heappush(queue, (nd, next(counter), neighbour))
+
+        if best is None:
+            return None
+
+        node, final_action = best
+        steps = [final_action]
+        while node in came_from:
+            node, action = came_from[node]
+            steps.append(action)
+
+        return underlying_edge(final_action[1]), steps
+
+    def get_metrics(self):
+        return {
+            'planning_time': self.planning_time,
+            'replans': self.replans,
+            'idle_workers': len(self.idle)
+        }
+
+
+def underlying_edge(edge: Edge | SubGraphEdge) -> Edge:
+    return edge.edge if isinstance(edge, SubGraphEdge) else edge
+
+def home_edges(sub_graph: SubGraph) -> set[Edge]:
+    return set(sub_graph.edges) | {e.edge for e in sub_graph.sub_graph_edges}
+
+def build_adjacency(sub_graphs) -> dict[Node, list[tuple[Node, Edge | SubGraphEdge]]]:
+    """Per-node actions exactly as SubGraph.find_neighbours would return them, built in one pass."""
+    adjacency: dict[Node, list[tuple[Node, Edge | SubGraphEdge]]] = {}
+
+    for sub_graph in sub_graphs:
+        for edge in sub_graph.edges:
+            adjacency.setdefault(edge.start, []).append((edge.end, edge))
+            if not edge.oneway:
+                adjacency.setdefault(edge.end, []).append((edge.start, edge))
+
+        for e in sub_graph.sub_graph_edges:
+            edge = e.edge
+            if edge.start in sub_graph.nodes:
+                adjacency.setdefault(edge.start, []).append((edge.end, e))
+            if not edge.oneway and edge.end in sub_graph.nodes:
+                adjacency.setdefault(edge.end, []).append((edge.start, e))
+
+    return adjacency
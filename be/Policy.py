@@ -0,0 +1,44 @@
+"""Policies for headless runs outside a TrainingSession: batch evaluation (Evaluate.py) and simulation shards (Sharding.py)."""
+from SubGraph import Y_RANGE, MAX_ACTIONS
+
+
+def check_policy(policy: str):
+    """Raise FileNotFoundError or ValueError if policy names model weights that are missing or don't fit the network."""
+    if policy == 'planner':
+        return
+
+    from Agent import InferenceAgent
+    InferenceAgent(
+        state_dim=(Y_RANGE ** 2) * 6 + 100 * 2 + MAX_ACTIONS * 2,
+        action_dim=MAX_ACTIONS,
+        model_path=policy,
+        quantize=False
+    )
+
+def make_policy(policy: str, world, epsilon: float, quantize: bool):
+    """Returns act(worker) -> (Node, Edge | SubGraphEdge) | None for a World or a shard's ShardWorld.
+
+    policy is 'planner' or the path of model weights to run in inference mode.
+    """
+    if policy == 'planner':
+        from Planner import RoutePlanner
+        planner = RoutePlanner(world)
+        return planner.next_action
+
+    import torch
+    from Agent import InferenceAgent
+
+    # Callers run one policy per process (Evaluate's pool, Sharding's shards); extra intra-op threads only oversubscribe the CPU
+    torch.set_num_threads(1)
+    agent = InferenceAgent(
+        state_dim=(Y_RANGE ** 2) * 6 + 100 * 2 + MAX_ACTIONS * 2,
+        action_dim=MAX_ACTIONS,
+        epsilon=epsilon,
+        model_path=policy,
+        quantize=quantize
+    )
+
+    def act(worker):
+        action = agent.act(worker.state, worker.action_mask)
+        return worker.current_actions[action] if action < len(worker.current_actions) else None
+    return act
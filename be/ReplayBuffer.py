@@ -0,0 +1,332 @@
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """In-memory experience replay: a ring of `capacity` (state, action, reward, next_state, done, next_mask) tuples."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.memory = []
+        self.position = 0
+
+    def __len__(self):
+        return len(self.memory)
+
+    def append(self, state, action, reward, next_state, done, next_mask) -> int:
+        """Store a transition, replacing the oldest once full. Returns the slot it was written to."""
+        i = self.position
+        transition = (state, action, reward, next_state, done, next_mask)
+        if len(self.memory) < self.capacity:
+            self.memory.append(transition)
+        else:
+            self.memory[i] = transition
+        self.position = (i + 1) % self.capacity
+        return i
+
+    def sample(self, batch_size: int):
+        """A random batch as numpy arrays: states, actions, rewards, next_states, dones, next_masks."""
+        return self.gather(random.sample(range(len(self.memory)), batch_size))
+
+    def gather(self, indices):
+        """The transitions in the given slots, as sample() returns them."""
+        states, actions, rewards, next_states, dones, next_masks = zip(*(self.memory[i] for i in indices))
+        return (
+            np.asarray(states, dtype=np.float32),
+            np.asarray(actions, dtype=np.int64),
+            np.asarray(rewards, dtype=np.float32),
+            np.asarray(next_states, dtype=np.float32),
+            np.asarray(dones, dtype=np.float32),
+            np.asarray(next_masks, dtype=bool)
+        )
+
+    def flush(self):
+        pass
+
+    def close(self, delete: bool = False):
+        pass
+
+    def memory_bytes(self):
+        """Approximate size of the buffer, extrapolated from its newest transition."""
+        if not self.memory:
+            return 0
+
+        transition = self.memory[self.position - 1]
+        state, next_state = transition[0], transition[3]
+        per_transition = sys.getsizeof(transition) + sys.getsizeof(state) + sys.getsizeof(next_state)
+        # Padding zeros are cached small ints, only floats cost memory per element
+        per_transition += sum(sys.getsizeof(x) for x in state if isinstance(x, float))
+        per_transition += sum(sys.getsizeof(x) for x in next_state if isinstance(x, float))
+        return per_transition * len(self.memory)
+
+
+class MemmapReplayBuffer:
+    """Experience replay stored in fixed-width records in memory-mapped files.
+
+    Each field lives in its own file under `directory` (states and next_states as
+    `state_dtype`, actions, dones and the next state's action masks as uint8,
+    rewards as float32), written as a
+    ring of `capacity` records. The OS pages records in and out, so the buffer can
+    be far larger than RAM, and sampling is a vectorized fancy-index read. flush()
+    syncs the files and records the fill level in meta.json; a buffer reopened with
+    the same shape picks up where it left off.
+
+    States hold raw longitude/latitude coordinates, which float16 cannot resolve
+    finer than a few kilometres, so float32 is the default state_dtype.
+
+    Only one buffer in the process may have a directory open at a time: opening
+    one that is in use waits up to claim_timeout seconds for close() and then
+    raises RuntimeError.
+    """
+
+    open_directories = set()
+    open_directories_cond = threading.Condition()
+
+    def __init__(self, directory: str, capacity: int, state_dim: int, state_dtype: str = 'float32', action_dim: int = 4, claim_timeout: float = 10.0):
+        self.directory = os.path.realpath(directory)
+        with self.open_directories_cond:
+            if not self.open_directories_cond.wait_for(lambda: self.directory not in self.open_directories, claim_timeout):
+                raise RuntimeError(f"Replay buffer in {directory} is already open in another session")
+            self.open_directories.add(self.directory)
+        self.closed = False
+
+        try:
+            self._open_files(capacity, state_dim, state_dtype, action_dim)
+        except Exception:
+            self._release()
+            raise
+
+    def _open_files(self, capacity, state_dim, state_dtype, action_dim):
+        directory = self.directory
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.state_dtype = np.dtype(state_dtype)
+        self.meta_path = os.path.join(directory, 'meta.json')
+        os.makedirs(directory, exist_ok=True)
+
+        self.size = 0
+        self.position = 0
+        self.rng = np.random.default_rng()
+        meta = self._read_meta()
+        shape = {'capacity': capacity, 'state_dim': state_dim, 'state_dtype': self.state_dtype.name, 'action_dim': action_dim}
+        resume = meta is not None and all(meta.get(k) == v for k, v in shape.items())
+        if meta is not None and not resume:
+            print(f"Replay buffer in {directory} has a different shape ({meta}), starting it over")
+        mode = 'r+' if resume else 'w+'
+
+        self.states = self._open('states', self.state_dtype, (capacity, state_dim), mode)
+        self.next_states = self._open('next_states', self.state_dtype, (capacity, state_dim), mode)
+        self.actions = self._open('actions', np.uint8, (capacity,), mode)
+        self.rewards = self._open('rewards', np.float32, (capacity,), mode)
+        self.dones = self._open('dones', np.uint8, (capacity,), mode)
+        self.next_masks = self._open('next_masks', np.uint8, (capacity, action_dim), mode)
+
+        if resume:
+            self.size = meta['size']
+            self.position = meta['position']
+            print(f"Replay buffer resumed with {self.size} transitions from {directory}")
+        else:
+            self.flush()
+
+    def _open(self, name, dtype, shape, mode):
+        return np.memmap(os.path.join(self.directory, f'{name}.bin'), dtype=dtype, mode=mode, shape=shape)
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state, done, next_mask) -> int:
+        i = self.position
+        self.states[i] = state
+        self.next_states[i] = next_state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.next_masks[i] = next_mask
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def sample(self, batch_size: int):
+        """A random batch as numpy arrays: states, actions, rewards, next_states, dones, next_masks."""
+        # Sorted indices turn the gather into a forward scan over the files. Generator.choice draws without
+        # replacement in O(batch_size); the legacy np.random.choice permutes all `size` slots on every call.
+        return self.gather(np.sort(self.rng.choice(self.size, batch_size, replace=False)))
+
+    def gather(self, indices):
+        """The records in the given slots, as sample() returns them."""
+        return (
+            self.states[indices].astype(np.float32),
+            self.actions[indices].astype(np.int64),
+            np.asarray(self.rewards[indices]),
+            self.next_states[indices].astype(np.float32),
+            self.dones[indices].astype(np.float32),
+            self.next_masks[indices].astype(bool)
+        )
+
+    def flush(self):
+        """Sync the records to disk, then record how many of them are valid."""
+        if self.closed:
+            return
+        size, position = self.size, self.position
+        for array in (self.states, self.next_states, self.actions, self.rewards, self.dones, self.next_masks):
+            array.flush()
+
+        tmp_path = f'{self.meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'capacity': self.capacity,
+                'state_dim': self.state_dim,
+                'state_dtype': self.state_dtype.name,
+                'action_dim': self.action_dim,
+                'size': size,
+                'position': position
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def close(self, delete: bool = False):
+        """Flush (or, with delete, remove) the files and let another buffer open the directory."""
+        if self.closed:
+            return
+        self.closed = True
+        if delete:
+            self.states = self.next_states = self.actions = self.rewards = self.dones = self.next_masks = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+        else:
+            self.flush()
+        self._release()
+
+    def _release(self):
+        with self.open_directories_cond:
+            self.open_directories.discard(self.directory)
+            self.open_directories_cond.notify_all()
+
+    @classmethod
+    def is_open(cls, directory: str) -> bool:
+        with cls.open_directories_cond:
+            return os.path.realpath(directory) in cls.open_directories
+
+    @staticmethod
+    def disk_bytes(directory: str) -> int:
+        """Full length of the directory's files. Sparse filesystems allocate less until they fill, but NTFS allocates it all up front."""
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    @staticmethod
+    def record_bytes(state_dim: int, state_dtype: str = 'float32', action_dim: int = 4) -> int:
+        """Bytes one transition takes across the record files."""
+        return 2 * state_dim * np.dtype(state_dtype).itemsize + 1 + 4 + 1 + action_dim
+
+    @classmethod
+    def capacity_for(cls, budget: int, state_dim: int, state_dtype: str = 'float32', action_dim: int = 4) -> int:
+        """How many transitions fit in budget bytes of record files."""
+        return max(1, budget // cls.record_bytes(state_dim, state_dtype, action_dim))
+
+    def memory_bytes(self):
+        """Bytes of populated records; they live in the page cache rather than the Python heap."""
+        return self.record_bytes(self.state_dim, self.state_dtype, self.action_dim) * self.size
+
+
+class SumTree:
+    """Priorities for `capacity` slots in a binary tree where every node holds the sum of its children.
+
+    The leaves sit in the second half of one flat array, so updating a batch of
+    priorities and finding the slots at a batch of prefix sums each walk the
+    tree's log2(capacity) levels once, vectorized over the batch.
+    """
+
+    def __init__(self, capacity: int):
+        self.leaves = 1 << max(0, capacity - 1).bit_length()
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self) -> float:
+        return float(self.tree[1])
+
+    def get(self, indices) -> np.ndarray:
+        return self.tree[np.asarray(indices) + self.leaves]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.leaves
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values) -> np.ndarray:
+        """For each value in [0, total), the slot whose range of the running sum of priorities contains it."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = self.tree[2 * nodes]
+            right = values >= left
+            values -= left * right
+            nodes = 2 * nodes + right
+        return nodes - self.leaves
+
+
+class PrioritizedReplay:
+    """Proportional prioritized replay (Schaul et al., 2015) over a ReplayBuffer or MemmapReplayBuffer.
+
+    Each slot is drawn with probability priority ** alpha / total, where a
+    transition's priority is its last absolute TD error; new transitions get the
+    highest priority seen so far, so each is replayed at least about once.
+    sample() also returns the importance-sampling weight of each transition,
+    (len * P) ** -beta scaled so the largest is 1, and the slots it drew for
+    update_priorities(). Priorities are not saved: a resumed on-disk buffer
+    starts with every transition equally likely.
+    """
+
+    def __init__(self, buffer, alpha: float = 0.6, epsilon: float = 1e-3):
+        self.buffer = buffer
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.tree = SumTree(buffer.capacity)
+        self.max_priority = 1.0
+        if len(buffer):
+            self.tree.update(np.arange(len(buffer)), self.max_priority)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def append(self, state, action, reward, next_state, done, next_mask) -> int:
+        i = self.buffer.append(state, action, reward, next_state, done, next_mask)
+        self.tree.update([i], self.max_priority)
+        return i
+
+    def sample(self, batch_size: int, beta: float = 0.4):
+        """Like ReplayBuffer.sample, followed by the importance-sampling weights and the slots drawn."""
+        total = self.tree.total()
+        # One draw from each of batch_size equal stretches of the running sum, in ascending slot order
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        indices = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), len(self.buffer) - 1)
+
+        probabilities = self.tree.get(indices) / total
+        weights = (len(self.buffer) * probabilities) ** -beta
+        weights /= weights.max()
+        return (*self.buffer.gather(indices), weights.astype(np.float32), indices)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def flush(self):
+        self.buffer.flush()
+
+    def close(self, delete: bool = False):
+        self.buffer.close(delete)
+
+    def memory_bytes(self):
+        return self.buffer.memory_bytes() + self.tree.tree.nbytes
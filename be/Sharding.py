@@ -0,0 +1,356 @@
+"""Region-sharded simulation: groups of sub graphs stepped in separate processes.
+
+The coordinator owns the World the server built and splits its sub graphs into
+`num_shards` spatially contiguous groups with similar edge counts. Each shard
+process rebuilds the graph and the same sub graphs from a compact spec and
+steps only the workers currently inside its sub graphs. All cross-process
+state lives in shared memory:
+
+- clean: one byte per edge, written through by whichever shard cleans it
+- worker position, sub graph id and owning shard; a worker that crosses a
+  SubGraphEdge into another shard's region is handed off by rewriting its owner
+- per-shard counters (steps, actions, handoffs, busy time)
+
+Shards run in lockstep with the coordinator through a barrier: every step()
+releases all shards for one step and waits for them to finish, so handoffs and
+clean flags written during step k are seen by every shard at step k + 1.
+"""
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import threading
+import time
+
+import numpy as np
+
+from Edge import Edge
+from Graph import Graph
+from Location import RoadPriority
+from Node import Node
+from Policy import check_policy
+from SubGraph import SubGraphEdge, build_sub_graphs
+from Worker import Worker
+
+# Seconds a shard or the coordinator waits at the step barrier before giving up,
+# so shards exit on their own if the coordinator goes away
+BARRIER_TIMEOUT = 300
+
+STAT_STEPS = 0
+STAT_ACTIONS = 1
+STAT_HANDOFFS = 2
+STAT_BUSY_SECONDS = 3
+
+
+class SharedArray:
+    """A numpy array backed by a named shared memory block."""
+
+    def __init__(self, shape, dtype, name=None):
+        dtype = np.dtype(dtype)
+        self.shape = shape
+        self.dtype = dtype
+        self.owner = name is None
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(create=True, size=size) if self.owner else shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+        if self.owner:
+            self.array.fill(0)
+
+    def spec(self):
+        return (self.shape, self.dtype.str, self.shm.name)
+
+    @classmethod
+    def attach(cls, spec):
+        shape, dtype, name = spec
+        return cls(shape, dtype, name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedState:
+    def __init__(self, num_edges, num_workers, num_shards, specs=None):
+        specs = specs or {}
+        def array(key, shape, dtype):
+            return SharedArray.attach(specs[key]) if key in specs else SharedArray(shape, dtype)
+
+        self.clean = array('clean', (num_edges,), np.uint8)
+        self.positions = array('positions', (num_workers, 2), np.float64)
+        self.sub_graphs = array('sub_graphs', (num_workers,), np.int32)
+        self.owners = array('owners', (num_workers,), np.int32)
+        self.stats = array('stats', (num_shards, 4), np.float64)
+
+    def arrays(self):
+        return {'clean': self.clean, 'positions': self.positions, 'sub_graphs': self.sub_graphs, 'owners': self.owners, 'stats': self.stats}
+
+    def specs(self):
+        return {key: a.spec() for key, a in self.arrays().items()}
+
+    def close(self):
+        for a in self.arrays().values():
+            a.close()
+
+
+def assign_shards(sub_graphs, num_shards: int) -> dict[int, int]:
+    """Map sub graph id -> shard, cutting the west-to-east order of sub graphs into runs of similar edge count."""
+    def centre(s):
+        return (s.most_left + s.most_right) / 2, (s.most_down + s.most_up) / 2
+
+    ordered = sorted(sub_graphs, key=lambda s: (*centre(s), s.id))
+    total = sum(len(s.edges) + len(s.sub_graph_edges) for s in ordered) or 1
+
+    assignment = {}
+    shard = 0
+    running = 0
+    for s in ordered:
+        assignment[s.id] = shard
+        running += len(s.edges) + len(s.sub_graph_edges)
+        if running >= total * (shard + 1) / num_shards and shard < num_shards - 1:
+            shard += 1
+    return assignment
+
+def edge_key(edge: Edge) -> tuple[float, float, float, float]:
+    return (edge.start.x, edge.start.y, edge.end.x, edge.end.y)
+
+def underlying_edge(edge: Edge | SubGraphEdge) -> Edge:
+    return edge.edge if isinstance(edge, SubGraphEdge) else edge
+
+
+class ShardWorld:
+    """The parts of World a shard needs, rebuilt from the coordinator's spec instead of a Location."""
+
+    def __init__(self, spec, state: SharedState):
+        self.graph = Graph()
+        self.edges: list[Edge] = []
+        for sx, sy, ex, ey, oneway, priority, path in spec['edges']:
+            edge = Edge(Node(sx, sy), Node(ex, ey), oneway, RoadPriority(priority), [Node(x, y) for x, y in path])
+            self.graph.add_edge(edge)
+            self.edges.append(edge)
+
+        nodes = {(n.x, n.y): n for n in self.graph.nodes}
+        self.nodes = nodes
+        self.sub_graphs = build_sub_graphs(self.graph, [[nodes[xy] for xy in group] for group in spec['partition']])
+        self.sub_graphs_by_id = {s.id: s for s in self.sub_graphs}
+
+        self.workers: list[Worker] = []
+        for i in range(spec['num_workers']):
+            sub_graph = self.sub_graphs_by_id[int(state.sub_graphs.array[i])]
+            spawn = nodes[tuple(state.positions.array[i])]
+            self.workers.append(Worker(i, self.graph, sub_graph, self.workers, spawn_node=spawn))
+
+    def is_finished(self) -> bool:
+        return self.graph.clean_ratio() >= 1
+
+
+def run_shard(shard_id: int, spec: dict, specs: dict, barrier):
+    """Shard process entry point: step this shard's workers until the coordinator stops or the barrier breaks."""
+    state = SharedState(len(spec['edges']), spec['num_workers'], spec['num_shards'], specs)
+    try:
+        step_shard(shard_id, spec, state, barrier)
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        # Don't leave the coordinator and the other shards waiting for the barrier timeout
+        barrier.abort()
+        raise
+    finally:
+        try:
+            state.close()
+        except BufferError:
+            pass  # a traceback still references the arrays; the process is exiting anyway
+
+def step_shard(shard_id: int, spec: dict, state: SharedState, barrier):
+    world = ShardWorld(spec, state)
+    shard_of = spec['shard_of']
+    edge_ids = {id(e): i for i, e in enumerate(world.edges)}
+    local_clean = np.zeros(len(world.edges), dtype=np.uint8)
+
+    planner = None
+    if spec['policy'] == 'planner':
+        from Planner import RoutePlanner
+        planner = RoutePlanner(world)
+        act = planner.next_action
+    else:
+        from Policy import make_policy
+        act = make_policy(spec['policy'], world, spec['epsilon'], spec['quantize'])
+
+    owned = set()
+    stats = state.stats.array[shard_id]
+    while True:
+        barrier.wait(BARRIER_TIMEOUT)
+        started = time.perf_counter()
+
+        # Pull edges other shards cleaned since the last step
+        shared_clean = state.clean.array.copy()
+        for i in np.flatnonzero(shared_clean != local_clean):
+            world.edges[i].clean = bool(shared_clean[i])
+        local_clean = shared_clean
+
+        owners = state.owners.array
+        for worker in world.workers:
+            x, y = state.positions.array[worker.id]
+            worker.position = world.nodes[(x, y)]
+            worker.sub_graph = world.sub_graphs_by_id[int(state.sub_graphs.array[worker.id])]
+            if owners[worker.id] == shard_id and worker.id not in owned and planner is not None:
+                planner.forget(worker)
+
+        owned = {w.id for w in world.workers if owners[w.id] == shard_id}
+        for worker in world.workers:
+            if worker.id not in owned:
+                continue
+
+            if planner is None:
+                # Other workers and other shards' cleaning changed the observation since the last step
+                worker.state = worker.get_state()
+            action = act(worker)
+            if action is None and planner is not None:
+                continue
+
+            if action is not None:
+                i = edge_ids[id(underlying_edge(action[1]))]
+                state.clean.array[i] = 1
+                local_clean[i] = 1
+            worker.apply_action(action)
+            stats[STAT_ACTIONS] += 1
+
+            # Position and sub graph first, owner last: the new shard reads them after the barrier
+            state.positions.array[worker.id] = (worker.position.x, worker.position.y)
+            state.sub_graphs.array[worker.id] = worker.sub_graph.id
+            new_owner = shard_of[worker.sub_graph.id]
+            if new_owner != shard_id:
+                owners[worker.id] = new_owner
+                stats[STAT_HANDOFFS] += 1
+
+        stats[STAT_STEPS] += 1
+        stats[STAT_BUSY_SECONDS] += time.perf_counter() - started
+        barrier.wait(BARRIER_TIMEOUT)
+
+
+class ShardedSimulation:
+    """Coordinator for a World split across `num_shards` processes. Call start(), then step() until it returns False."""
+
+    def __init__(self, world, num_shards: int, policy: str = 'planner', epsilon: float = 0.05, quantize: bool = True):
+        # Checked here so a bad model fails the start instead of every shard process
+        check_policy(policy)
+        self.world = world
+        self.num_shards = num_shards
+        self.policy = policy
+        self.edges: list[Edge] = list(world.graph.edges)
+        self.edge_ids = {edge_key(e): i for i, e in enumerate(self.edges)}
+        self.shard_of = assign_shards(world.sub_graphs, num_shards)
+
+        ordered = sorted(world.sub_graphs, key=lambda s: s.id)
+        if [s.id for s in ordered] != list(range(len(ordered))):
+            raise ValueError("Sharding expects sub graph ids 0..n-1")
+
+        self.spec = {
+            'edges': [(*edge_key(e), e.oneway, e.priority.value, [(n.x, n.y) for n in e.path]) for e in self.edges],
+            'partition': [[(n.x, n.y) for n in s.nodes] for s in ordered],
+            'shard_of': self.shard_of,
+            'num_workers': len(world.workers),
+            'num_shards': num_shards,
+            'policy': policy,
+            'epsilon': epsilon,
+            'quantize': quantize
+        }
+
+        self.state = None
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.processes = []
+        self.barrier = None
+        self.last_actions = 0
+        self.stats = np.zeros((num_shards, 4))
+        self.owners = np.array([self.shard_of[w.sub_graph.id] for w in world.workers], dtype=np.int32)
+        self.local_clean = np.zeros(len(self.edges), dtype=np.uint8)
+        self.nodes = {(n.x, n.y): n for n in world.graph.nodes}
+        self.sub_graphs_by_id = {s.id: s for s in world.sub_graphs}
+
+    def start(self):
+        state = SharedState(len(self.edges), len(self.world.workers), self.num_shards)
+        self.state = state
+        state.clean.array[:] = [e.clean for e in self.edges]
+        for worker in self.world.workers:
+            state.positions.array[worker.id] = (worker.position.x, worker.position.y)
+            state.sub_graphs.array[worker.id] = worker.sub_graph.id
+            state.owners.array[worker.id] = self.shard_of[worker.sub_graph.id]
+
+        # spawn, not fork: the parent may be a threaded server with torch loaded
+        context = mp.get_context('spawn')
+        self.barrier = context.Barrier(self.num_shards + 1)
+        self.processes = [
+            context.Process(target=run_shard, args=(i, self.spec, state.specs(), self.barrier), daemon=True)
+            for i in range(self.num_shards)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def step(self) -> bool:
+        """Advance every shard by one step. Returns False once the map is clean, no shard has work left, or a shard died."""
+        try:
+            self.barrier.wait(BARRIER_TIMEOUT)
+            self.barrier.wait(BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            if not self.stopping:
+                print("Sharded simulation stopped: a shard did not reach the step barrier")
+            return False
+
+        with self.lock:
+            if self.state is None:
+                return False
+            self.sync()
+            actions = self.state.stats.array[:, STAT_ACTIONS].sum()
+        moved = actions > self.last_actions
+        self.last_actions = actions
+        return moved and not self.is_finished()
+
+    def sync(self):
+        """Copy the shared clean flags and worker placement into the coordinator's World."""
+        shared_clean = self.state.clean.array.copy()
+        for i in np.flatnonzero(shared_clean != self.local_clean):
+            self.edges[i].clean = bool(shared_clean[i])
+        self.local_clean = shared_clean
+
+        for worker in self.world.workers:
+            worker.position = self.nodes[tuple(self.state.positions.array[worker.id])]
+            worker.sub_graph = self.sub_graphs_by_id[int(self.state.sub_graphs.array[worker.id])]
+
+    def is_finished(self) -> bool:
+        return bool(self.local_clean.all())
+
+    def clean_ratio(self) -> float:
+        return float(self.local_clean.mean()) if len(self.local_clean) else 0.0
+
+    def stop(self):
+        # Breaking the barrier releases shards and a step() blocked in another thread
+        self.stopping = True
+        if self.barrier is not None:
+            self.barrier.abort()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+        with self.lock:
+            if self.state is not None:
+                self.stats = self.state.stats.array.copy()
+                self.owners = self.state.owners.array.copy()
+                self.state.close()
+                self.state = None
+
+    def get_metrics(self):
+        with self.lock:
+            if self.state is not None:
+                self.stats = self.state.stats.array.copy()
+                self.owners = self.state.owners.array.copy()
+        stats = self.stats
+        return {
+            'shards': self.num_shards,
+            'shard_steps': stats[:, STAT_STEPS].tolist(),
+            'shard_actions': stats[:, STAT_ACTIONS].tolist(),
+            'shard_busy_seconds': stats[:, STAT_BUSY_SECONDS].tolist(),
+            'handoffs': int(stats[:, STAT_HANDOFFS].sum()),
+            'workers_per_shard': np.bincount(self.owners, minlength=self.num_shards).tolist()
+        }
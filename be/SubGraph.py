@@ -1,7 +1,18 @@
+import math
+
 from Graph import Graph, Edge, Node
 
 Y_RANGE = 50
 X_RANGE = Y_RANGE * 5
+# Action slots per observation; road junctions with more streets than this are very rare
+MAX_ACTIONS = 8
+# Trained weights only fit the observation layout they were trained on, so the model file is named after it
+MODEL_FILE = f'model_eval_y{Y_RANGE}_a{MAX_ACTIONS}.pth'
+
+# Average number of nodes per sub graph for the balanced partitioner, matching the strips' Y_RANGE
+SUB_GRAPH_NODES = Y_RANGE
+# How far (as a fraction of its target weight) a split may drift from balance to cut fewer roads
+SPLIT_TOLERANCE = 0.02
 
 class SubGraphEdge:
     def __init__(self, edge: Edge, from_sub_graph, to_sub_graph):
@@ -22,6 +33,11 @@ class SubGraph(Graph):
         self.sub_graph_edges: set[SubGraphEdge] = set()
         self.id = id
 
+        # Observation parts shared by every worker in this sub graph (see Worker.get_state)
+        self.features: tuple[float, ...] = ()
+        self.features_version = -1
+        self.ordered_actions: dict[Node, list[tuple[Node, Edge | SubGraphEdge]]] = {}
+
     def add_edges_to_sub_graph(self, graph: Graph):
         # internal edges
         self.add_edges([e for e in graph.edges if e.start in self.nodes and e.end in self.nodes])
@@ -53,8 +69,35 @@ class SubGraph(Graph):
             
         return sub_graph_neighbours
 
+    def edge_features(self) -> tuple[float, ...]:
+        """Every edge vectorized and padded to Y_RANGE ** 2 edges, rebuilt only after an edge's clean state changed."""
+        if self.features_version != self.clean_version:
+            self.features_version = self.clean_version
+            features = [x for e in self.edges for x in e.vectorize()]
+            self.features = tuple(features) + (0,) * (6 * (Y_RANGE ** 2) - len(features))
+        return self.features
+
+    def actions_at(self, node: Node) -> list[tuple[Node, Edge | SubGraphEdge]]:
+        """find_neighbours(node) sorted by action_order. Edges don't change once sub graphs are built, so each node is sorted once."""
+        actions = self.ordered_actions.get(node)
+        if actions is None:
+            actions = self.ordered_actions[node] = sorted(self.find_neighbours(node), key=lambda action: action_order(node, action))
+        return actions
+
 
 # Static SubGraph Functions
+def action_order(node: Node, action: tuple[Node, Edge | SubGraphEdge]) -> tuple[float, float, float, float]:
+    """Sort key for a move from node: the direction it leaves in (counter-clockwise from east), then its destination and length."""
+    neighbour, edge = action
+    edge = edge.edge if isinstance(edge, SubGraphEdge) else edge
+    # A contracted road leaves towards its first interior point rather than its far end
+    if edge.path:
+        toward = edge.path[0] if edge.start == node else edge.path[-1]
+    else:
+        toward = neighbour
+    angle = math.atan2(toward.y - node.y, toward.x - node.x)
+    return (angle, neighbour.x, neighbour.y, edge.length)
+
 def find_sub_graph_with_node(sub_graphs: list[SubGraph], node: Node) -> SubGraph:
     for sub_graph in sub_graphs:
         if node in sub_graph.nodes:
@@ -62,9 +105,15 @@ def find_sub_graph_with_node(sub_graphs: list[SubGraph], node: Node) -> SubGraph
     
     return None
 
-def generate_sub_graphs(graph: Graph) -> set[SubGraph]:
-    sub_graphs: set[SubGraph] = set()
-    sub_graph_id = 0
+def generate_sub_graphs(graph: Graph, partitioner: str = 'balanced') -> set[SubGraph]:
+    return build_sub_graphs(graph, PARTITIONERS[partitioner](graph))
+
+def partition_strips(graph: Graph) -> list[list[Node]]:
+    """Original partitioner: x-rank strips of X_RANGE nodes cut into y-rank blocks of Y_RANGE.
+
+    round() drops leftover nodes at the end of each strip, so some roads end up in no sub graph.
+    """
+    node_groups: list[list[Node]] = []
     sorted_x_nodes = sorted(graph.nodes, key=lambda n: n.x)
     num_x_sections = round(len(sorted_x_nodes) / X_RANGE)
 
@@ -73,18 +122,126 @@ def generate_sub_graphs(graph: Graph) -> set[SubGraph]:
         sorted_y_nodes = sorted(x_section, key=lambda n: n.y)
         num_y_sections = round(len(sorted_y_nodes) / Y_RANGE)
         for y_sec_num in range(num_y_sections):
-            y_section = sorted_y_nodes[y_sec_num * Y_RANGE : (y_sec_num + 1) * Y_RANGE]
-            sub_graph = SubGraph(sub_graph_id, sub_graphs)
-            sub_graph_id += 1
-            sub_graph.add_nodes(y_section)
-            sub_graphs.add(sub_graph)
+            node_groups.append(sorted_y_nodes[y_sec_num * Y_RANGE : (y_sec_num + 1) * Y_RANGE])
+    
+    return node_groups
+
+def partition_balanced(graph: Graph) -> list[list[Node]]:
+    """Recursive bisection covering every node, balanced by edge count, preferring cuts that cross few roads.
+
+    Each split divides a region's node count target between two halves in
+    proportion, then looks within SPLIT_TOLERANCE of the balanced position on
+    both axes for the split that crosses the fewest edges.
+    """
+    nodes = list(graph.nodes)
+    if not nodes:
+        return []
+
+    # Each node carries half of its incident edges, so leaves balance by edge count
+    weight: dict[Node, float] = {n: 0.0 for n in nodes}
+    adjacency: dict[Node, list[Node]] = {n: [] for n in nodes}
+    for e in graph.edges:
+        weight[e.start] += 0.5
+        weight[e.end] += 0.5
+        adjacency[e.start].append(e.end)
+        adjacency[e.end].append(e.start)
+
+    # Enough leaves to keep sub graphs near SUB_GRAPH_NODES nodes and under the observation's edge cap
+    leaves = max(1, math.ceil(len(nodes) / SUB_GRAPH_NODES), math.ceil(len(graph.edges) / (Y_RANGE ** 2)))
+
+    node_groups: list[list[Node]] = []
+    stack = [(nodes, leaves)]
+    while stack:
+        region, parts = stack.pop()
+        if parts <= 1 or len(region) <= 1:
+            node_groups.append(region)
+            continue
+
+        left_parts = parts // 2
+        left, right = bisect(region, left_parts / parts, weight, adjacency)
+        stack.append((right, parts - left_parts))
+        stack.append((left, left_parts))
+
+    return node_groups
+
+def bisect(region: list[Node], fraction: float, weight: dict[Node, float], adjacency: dict[Node, list[Node]]) -> tuple[list[Node], list[Node]]:
+    """Split region so the first part holds about `fraction` of its weight, cutting as few edges as possible."""
+    total = sum(weight[n] for n in region)
+    target = total * fraction
+    low, high = target - total * SPLIT_TOLERANCE * fraction, target + total * SPLIT_TOLERANCE * fraction
+
+    best = None
+    for axis in (lambda n: (n.x, n.y), lambda n: (n.y, n.x)):
+        ordered = sorted(region, key=axis)
+        rank = {n: i for i, n in enumerate(ordered)}
+
+        # cuts[i] = number of edges crossing a split before ordered[i]
+        cuts = [0] * (len(ordered) + 1)
+        for n in ordered:
+            i = rank[n]
+            for m in adjacency[n]:
+                j = rank.get(m)
+                if j is not None and i < j:
+                    cuts[i + 1] += 1
+                    cuts[j + 1] -= 1
+        running = 0
+        prefix = 0.0
+        for i in range(1, len(ordered)):
+            running += cuts[i]
+            prefix += weight[ordered[i - 1]]
+            if prefix < low or prefix > high:
+                continue
+            score = (running, abs(prefix - target))
+            if best is None or score < best[0]:
+                best = (score, ordered, i)
+
+        if best is None:
+            # Nothing lands within tolerance (e.g. one very heavy node); take the closest split on this axis
+            prefix = 0.0
+            closest = None
+            for i in range(1, len(ordered)):
+                prefix += weight[ordered[i - 1]]
+                if closest is None or abs(prefix - target) < closest[0]:
+                    closest = (abs(prefix - target), i)
+            best = ((float('inf'), closest[0]), ordered, closest[1])
+
+    _, ordered, i = best
+    return ordered[:i], ordered[i:]
+
+def build_sub_graphs(graph: Graph, node_groups: list[list[Node]]) -> set[SubGraph]:
+    """One SubGraph per node group, with ids in group order, plus the internal and boundary edges between them.
+
+    Same result as calling add_edges_to_sub_graph on every sub graph, in one pass over the edges.
+    """
+    sub_graphs: set[SubGraph] = set()
+    owner: dict[Node, SubGraph] = {}
+    for sub_graph_id, nodes in enumerate(node_groups):
+        sub_graph = SubGraph(sub_graph_id, sub_graphs)
+        sub_graph.add_nodes(nodes)
+        sub_graphs.add(sub_graph)
+        for node in nodes:
+            owner.setdefault(node, sub_graph)
     
     # Calculate edges
-    for sub_graph in sub_graphs:
-        sub_graph.add_edges_to_sub_graph(graph)
+    for e in graph.edges:
+        start, end = owner.get(e.start), owner.get(e.end)
+        if start is None or end is None:
+            continue
+        if start is end:
+            start.add_edge(e)
+            continue
+
+        start.sub_graph_edges.add(SubGraphEdge(e, start, end))
+        if not e.oneway:
+            end.sub_graph_edges.add(SubGraphEdge(e, start, end))
     
     return sub_graphs
 
+PARTITIONERS = {
+    'strips': partition_strips,
+    'balanced': partition_balanced
+}
+
 def plot_sub_graphs(sub_graphs: set[SubGraph]):
     import matplotlib.pyplot as plt
     import random
@@ -1,40 +1,69 @@
 from World import World, Location
-from SubGraph import Y_RANGE
+from SubGraph import Y_RANGE, MAX_ACTIONS
 from Agent import DQNAgent
-from Game import Game
+import argparse
+import threading
 import time
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--headless', action='store_true', help='train without opening the pygame viewer')
+parser.add_argument('--prioritized', action='store_true', help='sample replay in proportion to TD error')
+args = parser.parse_args()
+
 agent = DQNAgent(
-    state_dim=(Y_RANGE ** 2) * 6 + 100 * 2 + 4 * 2,
-    action_dim=4
+    state_dim=(Y_RANGE ** 2) * 6 + 100 * 2 + MAX_ACTIONS * 2,
+    action_dim=MAX_ACTIONS,
+    prioritized=args.prioritized
 )
 
 place = "Kanata, Ontario, Canada"
-display = Game(None)
-
-for episode in range(500):
-    world = World(Location(place))
-    display.reset(world)
-    timer = time.time()
-    done = False
-    total_reward = 0
-
-    while not world.is_finished():
-        for worker in world.workers:
-            action = agent.act(worker.state)
-            next_state, reward, done = worker.play(action)
-
-            agent.remember(worker.state, action, reward, next_state, done)
-            agent.train()
-
-            worker.state = worker.get_state()
-            total_reward += reward
-            display.update()
-        
-        if time.time() - timer > 5:
-            timer = time.time()
-            print("Done: %", world.graph.clean_ratio() * 100)
-        
-    print(f'Episode {episode}, Reward: {total_reward}')
-
-display.quit()
\ No newline at end of file
+
+display = None
+if not args.headless:
+    # pygame is only imported (and its window opened) when we actually render
+    from Game import Game
+    display = Game(None)
+
+# Set when the viewer window is closed; training stops after the current step
+stop = threading.Event()
+
+def train():
+    for episode in range(500):
+        world = World(Location(place))
+        if display is not None:
+            display.show(world)
+        timer = time.time()
+        done = False
+        total_reward = 0
+
+        while not world.is_finished():
+            if stop.is_set():
+                return
+            for worker in world.workers:
+                action = agent.act(worker.state, worker.action_mask)
+                next_state, reward, done = worker.play(action)
+
+                agent.remember(worker.state, action, reward, next_state, done, worker.action_mask)
+                agent.train()
+
+                worker.state = next_state
+                total_reward += reward
+
+            if time.time() - timer > 5:
+                timer = time.time()
+                print("Done: %", world.graph.clean_ratio() * 100)
+
+        print(f'Episode {episode}, Reward: {total_reward}')
+
+if display is None:
+    train()
+else:
+    # The window has to stay on the main thread, so training moves to a worker thread and the
+    # viewer draws at its own frame rate however long a training step takes
+    trainer = threading.Thread(target=train)
+    trainer.start()
+    display.run(trainer.is_alive)
+    stop.set()
+    trainer.join()
+    display.quit()
+agent.checkpoints.flush()
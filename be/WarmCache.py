@@ -0,0 +1,136 @@
+"""Offline cache warming: build the server's graph cache entries for known cities ahead of time.
+
+Each city is geocoded (or given as bounds), downloaded with OSMnx, built into a World,
+partitioned into sub graphs and compressed in its own process. The results are written
+into api/cache pinned, so the disk budget never evicts them. Sessions on those bounds
+reuse the stored partition, and requests inside them are cropped from it.
+
+    python WarmCache.py --place "Ottawa, Canada" --place "Gatineau, Canada" --bounds 45.41,45.43,-75.71,-75.68
+    python WarmCache.py --file cities.txt --processes 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from World import World
+from Location import Location, load_osmnx
+from constants import GRAPH_CACHE_DISK_MB, GRAPH_CACHE_MEMORY_MB
+from graph_cache import GraphCache, CacheEntry, cache_dir, get_cache_key
+
+
+def place_bounds(place: str) -> list[float]:
+    """[min_lat, max_lat, min_lon, max_lon] of the place's boundary, as the map sends for a viewport."""
+    ox = load_osmnx()
+    min_lon, min_lat, max_lon, max_lat = ox.geocode_to_gdf(place).total_bounds
+    return [float(min_lat), float(max_lat), float(min_lon), float(max_lon)]
+
+def warm_target(task: dict) -> dict:
+    # World logs with print; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return build_target(task)
+        except Exception as e:
+            return {'name': task['name'], 'error': str(e)}
+
+def build_target(task: dict) -> dict:
+    started = time.perf_counter()
+    kind, value = task['target']
+    bounds = place_bounds(value) if kind == 'place' else value
+    cache_key = get_cache_key(bounds)
+    result = {'name': task['name'], 'bounds': bounds, 'cache_key': cache_key}
+    if cache_key in task['cached_keys']:
+        result['skipped'] = True
+        return result
+
+    fetch_start = time.perf_counter()
+    location = Location(bounds=bounds)
+    result['fetch_seconds'] = time.perf_counter() - fetch_start
+
+    build_start = time.perf_counter()
+    world = World(location, 0)
+    result['build_seconds'] = time.perf_counter() - build_start
+
+    serialize_start = time.perf_counter()
+    entry = CacheEntry.from_graph(cache_key, world.to_dict())
+    result['serialize_seconds'] = time.perf_counter() - serialize_start
+
+    result.update({
+        'nodes': len(world.graph.nodes),
+        'edges': len(world.graph.edges),
+        'sub_graphs': len(world.sub_graphs),
+        'bytes': len(entry.body),
+        'body': entry.body,
+        'wall_seconds': time.perf_counter() - started
+    })
+    return result
+
+def parse_targets(args) -> list[tuple[str, tuple]]:
+    specs = list(args.place or []) + [f'bounds:{b}' for b in args.bounds or []]
+    for path in args.file or []:
+        with open(path, 'r') as f:
+            specs.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+    targets = []
+    for spec in specs:
+        if spec.startswith('bounds:'):
+            values = [float(b) for b in spec[len('bounds:'):].split(',')]
+            if len(values) != 4:
+                raise ValueError(f"Invalid bounds {spec}. Expected min_lat,max_lat,min_lon,max_lon")
+            targets.append((spec, ('bounds', values)))
+        else:
+            targets.append((spec, ('place', spec)))
+    return targets
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the server's graph cache for a list of cities.")
+    parser.add_argument('--place', action='append', help='place name to geocode, e.g. "Ottawa, Canada"')
+    parser.add_argument('--bounds', action='append', help='min_lat,max_lat,min_lon,max_lon')
+    parser.add_argument('--file', action='append', help='text file with one place name or bounds:min_lat,max_lat,min_lon,max_lon per line')
+    parser.add_argument('--cache-dir', default=cache_dir)
+    parser.add_argument('--force', action='store_true', help='rebuild targets that are already cached')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    targets = parse_targets(args)
+    if not targets:
+        parser.error('No targets given. Use --place, --bounds or --file.')
+
+    with contextlib.redirect_stdout(sys.stderr):
+        cache = GraphCache(args.cache_dir, disk_budget=GRAPH_CACHE_DISK_MB * 1024 * 1024, memory_budget=GRAPH_CACHE_MEMORY_MB * 1024 * 1024)
+    cached_keys = set() if args.force else set(cache.index)
+    tasks = [{'name': name, 'target': target, 'cached_keys': cached_keys} for name, target in targets]
+
+    started = time.perf_counter()
+    results = []
+    # Workers only build; this process is the one writer of the cache and its index
+    with ProcessPoolExecutor(max_workers=min(args.processes, len(tasks))) as pool:
+        for result in pool.map(warm_target, tasks):
+            body = result.pop('body', None)
+            if body is not None:
+                with contextlib.redirect_stdout(sys.stderr):
+                    cache.store(result['bounds'], CacheEntry(result['cache_key'], body), pinned=True)
+                print(f"{result['name']}: {result['nodes']} nodes, {result['edges']} edges, {result['sub_graphs']} sub graphs, {result['bytes'] / 1024 / 1024:.2f} MB in {result['wall_seconds']:.1f}s", file=sys.stderr)
+            elif result.get('skipped'):
+                print(f"{result['name']}: already cached as {result['cache_key']}", file=sys.stderr)
+            else:
+                print(f"{result['name']}: failed: {result['error']}", file=sys.stderr)
+            results.append(result)
+
+    report = {'results': results, 'cache': cache.stats(), 'wall_seconds': time.perf_counter() - started}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from SubGraph import Node, SubGraph, Edge, SubGraphEdge, Y_RANGE, Graph
+from SubGraph import Node, SubGraph, Edge, SubGraphEdge, MAX_ACTIONS, Graph
 import random
 
 class Worker:
@@ -7,33 +7,62 @@ class Worker:
         self.workers: list[Worker] = workers
         self.graph = graph
         self.sub_graph: SubGraph = sub_graph
+        # (graph.position_version, workers part of the observation), rebuilt after any worker moves
+        self.worker_features: tuple[int, tuple[float, ...]] = (-1, ())
+        # The versions and sub graph the last observation was built from, and that observation
+        self.observed: tuple = ()
         self.position: Node = spawn_node if spawn_node is not None and spawn_node in sub_graph.nodes else random.sample(tuple(self.sub_graph.nodes), 1)[0]
     
     def setup_worker(self):
         self.current_actions = []
+        self.action_mask: tuple[bool, ...] = (False,) * MAX_ACTIONS
         self.state = self.get_state()
+
+    @property
+    def position(self) -> Node:
+        return self._position
+
+    @position.setter
+    def position(self, node: Node):
+        if getattr(self, '_position', None) != node:
+            self._position = node
+            self.graph.position_version += 1
     
     def play(self, action):
         return self.apply_action(self.current_actions[action] if action < len(self.current_actions) else None)
     
     def get_state(self) -> tuple[float, ...]:
-        workers = tuple([self.vectorize()] + [w.vectorize() for w in self.workers if w.id != self.id] + [(0, 0) for _ in range(100 - len(self.workers))])
-        workers = tuple(x for sub in workers for x in sub)
+        """This worker's observation: worker positions, its sub graph's edges and the moves from its node.
 
-        edges = tuple([e.vectorize() for e in self.sub_graph.edges] + [(0, 0, 0, 0, 0, 0) for _ in range((Y_RANGE ** 2) - len(self.sub_graph.edges))])
-        edges = tuple(x for sub in edges for x in sub)
+        Each part is rebuilt only when what it depends on changed, and the whole
+        observation is returned as-is if nothing did since the last call.
+        """
+        sub_graph = self.sub_graph
+        key = (self.graph.position_version, sub_graph, sub_graph.clean_version)
+        if self.observed and self.observed[0] == key:
+            return self.observed[1]
 
-        actions = self.actions()
-        actions = list(actions)
+        version, workers = self.worker_features
+        if version != self.graph.position_version:
+            workers = [self.position.x, self.position.y]
+            for w in self.workers:
+                if w.id != self.id:
+                    workers.extend((w.position.x, w.position.y))
+            workers = tuple(workers) + (0,) * (2 * (100 - len(self.workers)))
+            self.worker_features = (self.graph.position_version, workers)
+
+        # Every move from this node in a fixed order, so a slot means the same move each time the node is visited
+        actions = sub_graph.actions_at(self.position)[:MAX_ACTIONS]
 
-        if len(actions) > 4:
-            actions = random.sample(actions, 4)
-        
         self.current_actions = actions
-        actions = tuple([(node.x, node.y) for node,  _ in actions] + [(0, 0) for _ in range(4 - len(actions))])
+        # Valid slots are always a prefix; the rest are padding the agent must not pick
+        self.action_mask = tuple(i < len(actions) for i in range(MAX_ACTIONS))
+        actions = tuple([(node.x, node.y) for node,  _ in actions] + [(0, 0) for _ in range(MAX_ACTIONS - len(actions))])
         actions = tuple(x for sub in actions for x in sub)
 
-        return tuple(workers + edges + actions)
+        state = workers + sub_graph.edge_features() + actions
+        self.observed = (key, state)
+        return state
 
     
     def actions(self) -> set[tuple[Node, Edge | SubGraphEdge]]:
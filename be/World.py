@@ -2,12 +2,12 @@ import os, random
 from Graph import Graph
 from Node import Node
 from Edge import Edge
-from Location import Location
+from Location import Location, merge_reverse_edges, contract_chains
 from Worker import Worker
-from SubGraph import generate_sub_graphs, plot_sub_graphs
+from SubGraph import generate_sub_graphs, build_sub_graphs, plot_sub_graphs
 
 class World:
-    def __init__(self, location: Location, num_workers: int = 10):
+    def __init__(self, location: Location, num_workers: int = 10, node_groups: list[list[tuple[float, float]]] | None = None, contract: bool = False):
         self.graph = Graph()
         
         #Make a cache every time World()
@@ -33,18 +33,27 @@ class World:
             #else: Generate new simulation and store bounds in cache
             print(f"No cache found. Generating new bounds and saving to: {full_cache_path}")
 
-            for edge in location.get_edges():
+            edges = merge_reverse_edges(location.get_edges())
+            # Contracted worlds have one edge per road between intersections, so one action cleans the whole road
+            for edge in (contract_chains(edges) if contract else edges):
                 start = edge[0]
                 end = edge[1]
                 oneway = edge[2]
                 priority = edge[3]
+                path = [Node(x, y) for x, y in edge[4]] if contract else None
 
-                self.graph.add_edge(Edge(Node(start[0], start[1]), Node(end[0], end[1]), oneway, priority))
+                self.graph.add_edge(Edge(Node(start[0], start[1]), Node(end[0], end[1]), oneway, priority, path))
 
             #store bounds in cache
             self.graph.graph_to_csv(location)
         
-        self.sub_graphs = generate_sub_graphs(self.graph)
+        # Cached partitions are for the uncontracted graph
+        if node_groups is None or contract:
+            self.sub_graphs = generate_sub_graphs(self.graph)
+        else:
+            # A partition computed earlier for this graph (e.g. by WarmCache.py), as node coordinates per sub graph
+            nodes = {(n.x, n.y): n for n in self.graph.nodes}
+            self.sub_graphs = build_sub_graphs(self.graph, [[nodes[p] for p in group if p in nodes] for group in node_groups])
         sub_graphs_list = list(self.sub_graphs)
         
         self.workers: list[Worker] = []
@@ -54,6 +63,13 @@ class World:
         for worker in self.workers:
             worker.setup_worker()
     
+    def to_dict(self):
+        """Graph.to_dict() plus 'sub_graphs': the sub graph id of each node in 'nodes' (-1 if it has none)."""
+        result = self.graph.to_dict()
+        owner = {(n.x, n.y): s.id for s in self.sub_graphs for n in s.nodes}
+        result['sub_graphs'] = [owner.get((n['x'], n['y']), -1) for n in result['nodes']]
+        return result
+
     def plot_sub_graphs(self):
         plot_sub_graphs(self.sub_graphs)
 
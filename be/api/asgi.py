@@ -0,0 +1,91 @@
+"""Async serving mode: the same HTTP and socket API on an asyncio Socket.IO server.
+
+    cd be/api && uvicorn asgi:app --port 5000
+
+server.py under Flask-SocketIO's threading mode holds an OS thread for every
+connected client. Here connections are coroutines on one event loop. The
+socket handlers from server.py run in the default thread pool and the Flask
+routes in a pool of ASYNC_HTTP_WORKERS threads, so graph requests and
+simulation setup never block the loop. Each running
+simulation keeps its own thread, encodes each update there once, and hands
+the encoded packet to the loop to send to everyone in the session's room.
+"""
+import asyncio
+
+import socketio
+from a2wsgi import WSGIMiddleware
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+import server
+from constants import ASYNC_HTTP_WORKERS
+from metrics import updates_skipped
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+# Simulation updates carry the full state, so a client that hasn't received the last one only needs the newest
+SKIPPABLE_EVENTS = {'update'}
+
+
+class AsyncTransport:
+    """server.transport for the async server. Always called from worker threads, never from the loop itself.
+
+    Besides python-socketio's public API this reads each Engine.IO socket's
+    transport and outgoing queue, so python-engineio is pinned in requirements.txt.
+    """
+
+    def __init__(self):
+        # Set by the ASGI lifespan startup, before the server accepts any request
+        self.loop = None
+
+    def emit(self, event, data, to):
+        # Same packets AsyncServer.emit builds, but encoded on this thread: a full graph update is
+        # hundreds of kilobytes of JSON, which would stall every connection if encoded on the loop
+        encoded = sio.packet_class(sio_packet.EVENT, namespace='/', data=[event, data]).encode()
+        packets = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in (encoded if isinstance(encoded, list) else [encoded])]
+        # The calling thread doesn't wait for the send; the loop delivers packets in order
+        future = asyncio.run_coroutine_threadsafe(self.send(packets, to, event in SKIPPABLE_EVENTS), self.loop)
+        future.add_done_callback(self.report)
+
+    async def send(self, packets, to, skippable):
+        for _, eio_sid in list(sio.manager.get_participants('/', to)):
+            # Sending only queues the packets for the connection's writer; slow clients keep a backlog.
+            # Only websocket writers drain the queue as they go: a long-polling client's queue holds
+            # everything since its last poll, so it is never a sign of falling behind.
+            socket = sio.eio.sockets.get(eio_sid)
+            if skippable and socket is not None and socket.upgraded and not socket.queue.empty():
+                updates_skipped.inc()
+                continue
+            for p in packets:
+                await sio.eio.send_packet(eio_sid, p)
+
+    def enter_room(self, sid, room):
+        asyncio.run_coroutine_threadsafe(sio.enter_room(sid, room), self.loop).result()
+
+    def leave_room(self, sid, room):
+        asyncio.run_coroutine_threadsafe(sio.leave_room(sid, room), self.loop).result()
+
+    def report(self, future):
+        if future.exception() is not None:
+            print(f"Socket emit failed: {future.exception()}")
+
+transport = AsyncTransport()
+server.transport = transport
+
+
+async def start():
+    transport.loop = asyncio.get_running_loop()
+
+def register(event, handler):
+    async def dispatch(sid, data=None):
+        await asyncio.to_thread(handler, sid, data)
+    sio.on(event, dispatch)
+
+for event, handler in server.socket_handlers.items():
+    register(event, handler)
+
+# Load torch and the model weights in the background while the server starts accepting requests
+server.model_pool.warm_async()
+
+app = socketio.ASGIApp(sio, other_asgi_app=WSGIMiddleware(server.app, workers=ASYNC_HTTP_WORKERS), on_startup=start)
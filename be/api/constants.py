@@ -10,7 +10,51 @@ SIMULATION_UPDATE_INTERVAL = 0.05  # Update every 50ms
 # Time to wait between simulation steps (world.play() calls)
 SIMULATION_STEP_DELAY = 0.01  # 10ms between steps
 
+# Upper bound on the 'shards' a client can request; each shard is a separate process.
+# Sharding is opt-in (the default is one shard) and only runs evaluation or the planner. Shards step in
+# lockstep, so it only pays off on large maps with workers spread across regions and a core per shard;
+# on a 3600-node grid with clustered workers, 3 shards were slower than one process (24 s vs 20 s).
+MAX_SIMULATION_SHARDS = 8
+
+# Default for the 'contract_roads' start option: merge chains of degree-2 nodes so one action cleans a whole road
+SIMULATION_CONTRACT_ROADS = False
+
+# Graph Build Configuration
+GRAPH_BUILD_WORKERS = 2  # OSMnx fetches/graph builds that may run at once; requests for the same bounds share one
+GRAPH_JOB_RETENTION = 300  # Seconds a finished graph job stays available at /api/graph/jobs/<id>
+GRAPH_REQUEST_TIMEOUT = 120  # Seconds a synchronous /api/graph request waits before answering with the job instead
+GRAPH_CACHE_DISK_MB = 2048  # Compressed graphs kept in api/cache; least recently used entries are deleted beyond this
+GRAPH_CACHE_MEMORY_MB = 256  # Compressed graphs (including crops) kept in memory for repeat requests
+
 # Training Configuration
 MODEL_SAVE_INTERVAL = 100  # Save model every N training steps
+CHECKPOINT_VERSION_EVERY = 10  # Also keep a full versioned checkpoint every N saves
+CHECKPOINT_KEEP = 5  # Number of versioned checkpoints to retain
 TRAINING_BATCH_SIZE = 64
 TRAINING_BUFFER_SIZE = 100_000
+TRAINING_REPLAY_ON_DISK = False  # Opt-in: keep replay experience in memory-mapped files under api/replay/<session> so it survives restarts
+TRAINING_REPLAY_DISK_MB = 2048  # Size of one session's replay files; sets their capacity instead of TRAINING_BUFFER_SIZE
+TRAINING_REPLAY_TOTAL_DISK_MB = 8192  # All of api/replay; the least recently used idle buffers are deleted to make room for a new one
+TRAINING_REPLAY_STATE_DTYPE = 'float32'  # float16 halves the files but rounds raw lon/lat coordinates to kilometres
+TRAINING_PRIORITIZED_REPLAY = False  # Sample transitions in proportion to their last TD error instead of uniformly
+TRAINING_PRIORITY_ALPHA = 0.6  # 0 samples uniformly, 1 fully in proportion to TD error
+TRAINING_PRIORITY_BETA = 0.4  # Starting strength of the importance-sampling correction, annealed to 1
+TRAINING_PRIORITY_BETA_STEPS = 100_000  # Training steps over which the correction reaches full strength
+INFERENCE_SNAPSHOT_INTERVAL = 10  # Publish fresh weights to the acting network every N training steps
+
+# Profiling Configuration
+PROFILE_WINDOW = 1000  # Number of recent samples per phase used for timing percentiles
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples while the sampling profiler is on
+
+# Metrics Configuration
+METRICS_PAYLOAD_SAMPLE_EVERY = 20  # Measure the JSON size of every Nth socket update
+
+# Resumable Sessions
+SESSION_SNAPSHOT_INTERVAL = 500  # Snapshot training sessions to api/sessions every N steps (and when they stop)
+
+# Recording Configuration
+RECORDING_KEYFRAME_INTERVAL = 500  # Store the full clean state every N recorded steps so playback can seek
+REPLAY_STEPS_PER_SECOND = 100  # Playback rate at speed 1.0, in recorded steps per second
+
+# Async Server Configuration (asgi.py)
+ASYNC_HTTP_WORKERS = 32  # Threads serving the Flask routes; a /api/graph request can hold one for up to GRAPH_REQUEST_TIMEOUT
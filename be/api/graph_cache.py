@@ -0,0 +1,356 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+index_file = 'index.json'
+# Compression runs once per build (on the graph job thread); every hit after that is served as-is
+COMPRESS_LEVEL = 6
+
+
+def get_cache_key(bounds):
+    # Ensure bounds are properly formatted with full precision
+    if not bounds or len(bounds) != 4:
+        raise ValueError(f"Invalid bounds format: {bounds}")
+
+    # Round to 6 decimal places (about 0.1m precision) to avoid floating point precision issues
+    # but keep enough precision to distinguish different locations
+    rounded_bounds = [round(float(b), 6) for b in bounds]
+    bounds_str = json.dumps(rounded_bounds, sort_keys=True)
+    cache_key = hashlib.md5(bounds_str.encode()).hexdigest()
+
+    return cache_key
+
+def crop_graph(graph_dict, bounds):
+    """The part of a Graph.to_dict() payload inside bounds ([min_lat, max_lat, min_lon, max_lon]).
+
+    Like an OSMnx bbox query, an edge is kept only if both of its ends are inside.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounds
+    edges = graph_dict['edges']
+    if not edges:
+        return {**graph_dict, 'nodes': [], 'edges': []}
+
+    # Columns: start x, start y, end x, end y (x is longitude, y latitude)
+    coords = np.array([(e['start']['x'], e['start']['y'], e['end']['x'], e['end']['y']) for e in edges], dtype=np.float64)
+    xs, ys = coords[:, 0::2], coords[:, 1::2]
+    inside = (xs >= min_lon) & (xs <= max_lon) & (ys >= min_lat) & (ys <= max_lat)
+    keep = inside.all(axis=1)
+
+    kept = coords[keep]
+    # Nodes are exactly the ends of the kept edges, in first-seen order like Graph.to_dict()
+    points = kept.reshape(-1, 2)
+    _, first = np.unique(points, axis=0, return_index=True)
+    points = points[np.sort(first)]
+
+    if len(points) == 0:
+        bounds_dict = {'left': 0.0, 'right': 0.0, 'down': 0.0, 'up': 0.0}
+    else:
+        bounds_dict = {
+            'left': float(points[:, 0].min()),
+            'right': float(points[:, 0].max()),
+            'down': float(points[:, 1].min()),
+            'up': float(points[:, 1].max())
+        }
+
+    return {
+        'nodes': [{'x': float(x), 'y': float(y)} for x, y in points],
+        'edges': [e for e, k in zip(edges, keep) if k],
+        'bounds': bounds_dict
+    }
+
+
+class CacheEntry:
+    """A cached graph as gzip-compressed JSON, ready to be sent with Content-Encoding: gzip."""
+
+    def __init__(self, cache_key, body, etag=None):
+        self.cache_key = cache_key
+        self.body = body
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+
+    @classmethod
+    def from_graph(cls, cache_key, graph_dict):
+        data = json.dumps(graph_dict, separators=(',', ':')).encode()
+        return cls(cache_key, gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+
+    def json_bytes(self):
+        return gzip.decompress(self.body)
+
+    def graph(self):
+        return json.loads(self.json_bytes())
+
+
+class GraphCache:
+    """Compressed Graph.to_dict() payloads on disk, one file per requested bounds, with an index of their extents.
+
+    An exact match is served from the in-memory hot tier or read from disk
+    without being parsed. A request inside a cached extent is cropped from the
+    smallest such entry and kept in the hot tier. Disk and memory are each
+    held to a byte budget by evicting the least recently used entries.
+    """
+
+    def __init__(self, directory=cache_dir, disk_budget=None, memory_budget=None):
+        self.directory = directory
+        self.disk_budget = disk_budget
+        self.memory_budget = memory_budget
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # cache key -> {'bounds': [min_lat, max_lat, min_lon, max_lon], 'etag', 'size', 'used', 'pinned'}
+        self.index: dict[str, dict] = {}
+        # Modification time of index.json when this process last read or wrote it
+        self.index_mtime = None
+        # Parallel to `keys`; rows are the bounds of each indexed entry
+        self.keys: list[str] = []
+        self.extents = np.empty((0, 4), dtype=np.float64)
+        self.hot: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hot_bytes = 0
+        self.load_index()
+
+    def path(self, cache_key):
+        return os.path.join(self.directory, f'{cache_key}.json.gz')
+
+    def index_path(self):
+        return os.path.join(self.directory, index_file)
+
+    def load_index(self):
+        """Merge index.json (which another process, like WarmCache.py, may have written) into this cache's index."""
+        index_path = self.index_path()
+        index = {}
+        if os.path.exists(index_path):
+            try:
+                self.index_mtime = os.stat(index_path).st_mtime_ns
+                with open(index_path, 'r') as f:
+                    index = json.load(f)
+            except (IOError, OSError, json.JSONDecodeError) as e:
+                print(f"Cache index read error, rebuilding it: {e}")
+
+        changed = False
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name == index_file:
+                continue
+            # Uncompressed entries from before precompression: compress them in place
+            cache_key = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    graph_dict = json.load(f)
+                entry = CacheEntry.from_graph(cache_key, graph_dict)
+                self.write(entry)
+                os.remove(os.path.join(self.directory, name))
+            except (IOError, OSError, json.JSONDecodeError) as e:
+                print(f"Skipping unreadable cache file {name}: {e}")
+                continue
+
+            bounds = index.get(cache_key)
+            if not isinstance(bounds, list):
+                # Indexed by the extent of their data, which is always inside the bounds they were fetched for
+                data_bounds = graph_dict['bounds']
+                bounds = [data_bounds['down'], data_bounds['up'], data_bounds['left'], data_bounds['right']]
+            index[cache_key] = {'bounds': bounds, 'etag': entry.etag, 'size': len(entry.body), 'used': time.time()}
+            changed = True
+
+        for name in os.listdir(self.directory):
+            cache_key = name[:-len('.json.gz')]
+            if not name.endswith('.json.gz') or isinstance(index.get(cache_key), dict) or cache_key in self.index:
+                continue
+            # Stored entries missing from the index (it was lost or corrupt): index them so they are served,
+            # counted against the disk budget and evicted like any other
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                data_bounds = json.loads(gzip.decompress(body))['bounds']
+            except (IOError, OSError, EOFError, ValueError, KeyError, TypeError) as e:
+                print(f"Skipping unreadable cache file {name}: {e}")
+                continue
+            index[cache_key] = {
+                'bounds': [data_bounds['down'], data_bounds['up'], data_bounds['left'], data_bounds['right']],
+                'etag': hashlib.sha1(body).hexdigest(),
+                'size': len(body),
+                'used': os.path.getmtime(path)
+            }
+            changed = True
+
+        for cache_key, meta in self.index.items():
+            if cache_key not in index or index[cache_key].get('used', 0) < meta['used']:
+                index[cache_key] = meta
+                changed = True
+
+        self.index = {k: v for k, v in index.items() if isinstance(v, dict) and os.path.exists(self.path(k))}
+        changed = changed or len(self.index) != len(index)
+        self.rebuild_extents()
+        if changed:
+            self.save_index()
+
+    def refresh(self):
+        """Pick up entries written by other processes since the index was last read. Call with the lock held."""
+        try:
+            mtime = os.stat(self.index_path()).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self.index_mtime:
+            self.load_index()
+
+    def rebuild_extents(self):
+        self.keys = list(self.index)
+        self.extents = np.array([self.index[k]['bounds'] for k in self.keys], dtype=np.float64).reshape(-1, 4)
+
+    def save_index(self):
+        index_path = self.index_path()
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, index_path)
+            self.index_mtime = os.stat(index_path).st_mtime_ns
+        except (IOError, OSError) as e:
+            print(f"Cache index write error: {e}")
+
+    def write(self, entry):
+        tmp_path = f'{self.path(entry.cache_key)}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(entry.body)
+        os.replace(tmp_path, self.path(entry.cache_key))
+
+    def find_containing(self, bounds):
+        """Cache key of the smallest cached extent that fully contains bounds, or None."""
+        min_lat, max_lat, min_lon, max_lon = [round(float(b), 6) for b in bounds]
+        with self.lock:
+            if len(self.keys) == 0:
+                return None
+            e = self.extents
+            contains = (e[:, 0] <= min_lat) & (e[:, 1] >= max_lat) & (e[:, 2] <= min_lon) & (e[:, 3] >= max_lon)
+            if not contains.any():
+                return None
+            areas = np.where(contains, (e[:, 1] - e[:, 0]) * (e[:, 3] - e[:, 2]), np.inf)
+            return self.keys[int(np.argmin(areas))]
+
+    def remember(self, entry):
+        """Put an entry at the front of the hot tier, dropping the coldest ones over the memory budget."""
+        with self.lock:
+            previous = self.hot.pop(entry.cache_key, None)
+            if previous is not None:
+                self.hot_bytes -= len(previous.body)
+            if self.memory_budget is not None and len(entry.body) > self.memory_budget:
+                return
+            self.hot[entry.cache_key] = entry
+            self.hot_bytes += len(entry.body)
+            while self.memory_budget is not None and self.hot_bytes > self.memory_budget:
+                _, evicted = self.hot.popitem(last=False)
+                self.hot_bytes -= len(evicted.body)
+
+    def touch(self, cache_key):
+        with self.lock:
+            if cache_key in self.hot:
+                self.hot.move_to_end(cache_key)
+            if cache_key in self.index:
+                self.index[cache_key]['used'] = time.time()
+
+    def read(self, cache_key):
+        """The stored entry for cache_key, from memory if it is hot, else from disk. Raises IOError if missing."""
+        with self.lock:
+            entry = self.hot.get(cache_key)
+        if entry is not None:
+            self.touch(cache_key)
+            return entry
+
+        with open(self.path(cache_key), 'rb') as f:
+            body = f.read()
+        etag = self.index.get(cache_key, {}).get('etag')
+        entry = CacheEntry(cache_key, body, etag)
+        self.remember(entry)
+        # Last use is only kept in memory here; the next put() or eviction writes it to index.json
+        self.touch(cache_key)
+        return entry
+
+    def get(self, bounds):
+        """(CacheEntry, result) where result is 'hit', 'contained', 'miss' or 'error'."""
+        cache_key = get_cache_key(bounds)
+        try:
+            with self.lock:
+                self.refresh()
+                stored = cache_key in self.hot or cache_key in self.index
+            if stored:
+                print(f"Cache hit! Using cache entry: {cache_key} for bounds: {bounds}")
+                return self.read(cache_key), 'hit'
+
+            superset_key = self.find_containing(bounds)
+            if superset_key is None:
+                print(f"Cache miss! No cache file found for bounds: {bounds} (cache key: {cache_key})")
+                return None, 'miss'
+
+            print(f"Cache hit! Cropping bounds: {bounds} from cache entry: {superset_key}")
+            # Crops only live in the hot tier; the superset on disk already covers them
+            entry = CacheEntry.from_graph(cache_key, crop_graph(self.read(superset_key).graph(), bounds))
+            self.remember(entry)
+            return entry, 'contained'
+        except (IOError, OSError, json.JSONDecodeError) as e:
+            print(f"Cache read error: {e}")
+            return None, 'error'
+
+    def put(self, bounds, graph_dict):
+        """Compress and store a freshly built graph. Returns its CacheEntry even if writing it to disk fails."""
+        return self.store(bounds, CacheEntry.from_graph(get_cache_key(bounds), graph_dict))
+
+    def store(self, bounds, entry, pinned=False):
+        """Store an already compressed entry. Pinned entries are never evicted to meet the disk budget."""
+        cache_key = entry.cache_key
+        if not pinned:
+            self.remember(entry)
+
+        try:
+            self.write(entry)
+            print(f"Graph cached successfully to: {cache_key}.json.gz for bounds: {bounds}")
+            print(f"Cache file size: {len(entry.body) / 1024 / 1024:.2f} MB compressed")
+        except (IOError, OSError) as e:
+            print(f"Cache write error: {e}")
+            return entry
+
+        with self.lock:
+            self.refresh()
+            self.index[cache_key] = {
+                'bounds': [round(float(b), 6) for b in bounds],
+                'etag': entry.etag,
+                'size': len(entry.body),
+                'used': time.time(),
+                'pinned': pinned or self.index.get(cache_key, {}).get('pinned', False)
+            }
+            self.evict(keep=cache_key)
+            self.rebuild_extents()
+            self.save_index()
+        return entry
+
+    def disk_bytes(self):
+        return sum(meta['size'] for meta in self.index.values())
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits its disk budget. Call with the lock held."""
+        if self.disk_budget is None:
+            return
+        total = self.disk_bytes()
+        for cache_key in sorted(self.index, key=lambda k: self.index[k]['used']):
+            if total <= self.disk_budget:
+                break
+            if cache_key == keep or self.index[cache_key].get('pinned'):
+                continue
+            try:
+                os.remove(self.path(cache_key))
+            except OSError as e:
+                print(f"Cache eviction error: {e}")
+                continue
+            total -= self.index.pop(cache_key)['size']
+            print(f"Evicted cache entry {cache_key} to stay within {self.disk_budget / 1024 / 1024:.0f} MB")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.index),
+                'disk_bytes': self.disk_bytes(),
+                'hot_entries': len(self.hot),
+                'hot_bytes': self.hot_bytes
+            }
@@ -0,0 +1,132 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GraphJob:
+    """One graph build shared by every caller that asked for the same bounds while it was running."""
+
+    def __init__(self, cache_key, bounds, force_refresh=False):
+        self.id = uuid.uuid4().hex
+        self.cache_key = cache_key
+        self.bounds = bounds
+        self.force_refresh = force_refresh
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Waiting for a build slot'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.subscribers: set[str] = set()
+        self.done = threading.Event()
+
+    def is_done(self):
+        return self.done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the build finishes. Returns the graph dict, or raises the build's error."""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Graph job {self.id} is still {self.status}")
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.result
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'bounds': self.bounds
+        }
+
+
+class GraphJobQueue:
+    """Runs graph builds on a small thread pool with single-flight deduplication by cache key.
+
+    `build(job, report)` does the work and returns the graph dict, calling
+    report(status, progress, message) as it goes; every report is passed to
+    `notify(job)` so the server can push it to the job's subscribers.
+    """
+
+    def __init__(self, build, max_workers=2, retention=300):
+        self.build = build
+        self.notify = None
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.jobs: dict[str, GraphJob] = {}
+        self.in_flight: dict[str, GraphJob] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='graph-job')
+        self.started = 0
+        self.deduplicated = 0
+
+    def submit(self, cache_key, bounds, force_refresh=False, subscriber=None) -> tuple[GraphJob, bool]:
+        """The running job for this cache key, or a new one. Returns (job, created)."""
+        with self.lock:
+            self._expire()
+            job = self.in_flight.get(cache_key)
+            created = job is None
+            if created:
+                job = GraphJob(cache_key, bounds, force_refresh)
+                self.jobs[job.id] = job
+                self.in_flight[cache_key] = job
+                self.started += 1
+            else:
+                self.deduplicated += 1
+            if subscriber is not None:
+                job.subscribers.add(subscriber)
+
+        if created:
+            self.executor.submit(self._run, job)
+        return job, created
+
+    def get(self, job_id) -> GraphJob | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def subscribe(self, job_id, subscriber) -> GraphJob | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.subscribers.add(subscriber)
+            return job
+
+    def unsubscribe_all(self, subscriber):
+        with self.lock:
+            for job in self.jobs.values():
+                job.subscribers.discard(subscriber)
+
+    def _report(self, job, status, progress, message):
+        job.status = status
+        job.progress = progress
+        job.message = message
+        if self.notify is not None:
+            try:
+                self.notify(job)
+            except Exception as e:
+                print(f"Graph job notification failed: {e}")
+
+    def _run(self, job):
+        try:
+            job.result = self.build(job, lambda status, progress, message: self._report(job, status, progress, message))
+            status, message = 'done', 'Graph ready'
+        except Exception as e:
+            job.error = str(e)
+            status, message = 'error', str(e)
+            print(f"Graph job {job.id} failed: {e}")
+
+        with self.lock:
+            # Later requests for these bounds start a fresh job (or hit the cache the build just wrote)
+            if self.in_flight.get(job.cache_key) is job:
+                del self.in_flight[job.cache_key]
+            job.finished = time.time()
+        job.done.set()
+        self._report(job, status, 1.0 if status == 'done' else job.progress, message)
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self.jobs[job_id]
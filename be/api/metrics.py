@@ -0,0 +1,120 @@
+import threading
+
+# Default buckets (seconds) for durations ranging from a socket emit to an OSMnx download
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values: dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f'{self.name}{format_labels(dict(key))} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_sum {format_value(self.sum)}')
+            lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated where events happen. Collectors are
+    called at scrape time for values that live on other objects (sessions,
+    agents) and return (name, type, help, [(labels, value), ...]) tuples.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        for collector in self.collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+graph_cache_lookups = registry.counter('snowyday_graph_cache_lookups_total', 'Graph cache lookups by result (hit, contained, miss, error).')
+graph_jobs_submitted = registry.counter('snowyday_graph_jobs_total', 'Graph build requests by result (started, deduplicated).')
+osmnx_fetch_seconds = registry.histogram('snowyday_osmnx_fetch_seconds', 'Time spent downloading and building OSMnx graphs.')
+emit_seconds = registry.histogram('snowyday_emit_seconds', 'Time spent emitting one simulation update over the socket.')
+emit_payload_bytes = registry.histogram('snowyday_emit_payload_bytes', 'JSON size of sampled simulation updates.',
+                                        (1_000, 10_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000))
+updates_skipped = registry.counter('snowyday_socket_updates_skipped_total', 'Simulation updates not sent to a websocket client that had not received the previous one yet (async server only).')
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+
+
+class ModelPool:
+    """Loads the model weights once and shares them with every new session.
+
+    Sessions used to each import torch and read the model file from disk when they
+    started. The pool does both once (in the background at server boot) and hands
+    out the same in-memory state_dict, only re-reading the file after a
+    checkpoint has replaced it.
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.lock = threading.Lock()
+        self.state_dict = None
+        self.loaded_mtime = None
+
+    def warm(self):
+        """Import torch/the agent and load the weights so the first session doesn't pay for it."""
+        start_time = time.time()
+        import Agent  # noqa: F401 (pulls in torch)
+        self.get()
+        print(f"Model pool warmed in {time.time() - start_time:.2f} seconds")
+
+    def warm_async(self):
+        thread = threading.Thread(target=self.warm, daemon=True)
+        thread.start()
+        return thread
+
+    def get(self):
+        """Current weights as a state_dict, or None if no model has been saved yet. Callers must not modify it."""
+        import torch
+
+        with self.lock:
+            try:
+                mtime = os.path.getmtime(self.model_path)
+            except OSError:
+                return None
+
+            if mtime != self.loaded_mtime:
+                self.state_dict = torch.load(self.model_path, weights_only=True)
+                self.loaded_mtime = mtime
+                print(f"Model pool loaded weights from {self.model_path}")
+
+            return self.state_dict
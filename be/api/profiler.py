@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+from collections import deque, Counter
+
+
+class PhaseTimer:
+    """Rolling per-phase timings with lifetime counters.
+
+    Callers time phases themselves with time.perf_counter() and hand in the
+    duration, which keeps the hot path to two clock reads and a deque append.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples: dict[str, deque] = {}
+        self.counts: Counter = Counter()
+        self.totals: dict[str, float] = {}
+
+    def record(self, phase, seconds):
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+            self.totals[phase] = 0.0
+        samples.append(seconds)
+        self.counts[phase] += 1
+        self.totals[phase] += seconds
+
+    def summary(self):
+        """Percentiles (in milliseconds) over the rolling window plus lifetime count/total per phase."""
+        result = {}
+        for phase, samples in list(self.samples.items()):
+            ordered = sorted(samples)
+            if not ordered:
+                continue
+            result[phase] = {
+                'count': self.counts[phase],
+                'total_s': self.totals[phase],
+                'mean_ms': sum(ordered) / len(ordered) * 1000,
+                'p50_ms': percentile(ordered, 0.50) * 1000,
+                'p90_ms': percentile(ordered, 0.90) * 1000,
+                'p99_ms': percentile(ordered, 0.99) * 1000,
+                'max_ms': ordered[-1] * 1000
+            }
+        return result
+
+
+def percentile(ordered, q):
+    index = min(len(ordered) - 1, int(q * len(ordered)))
+    return ordered[index]
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack on an interval and writes collapsed stacks.
+
+    The output is in the folded format understood by flamegraph.pl and speedscope,
+    one "frame;frame;frame count" line per distinct stack.
+    """
+
+    def __init__(self, thread_id, output_path, interval=0.005):
+        self.thread_id = thread_id
+        self.output_path = output_path
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop sampling and write the collected stacks. Returns the output path."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+        with open(self.output_path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        print(f"Profile written to {self.output_path} ({self.samples} samples)")
+        return self.output_path
@@ -0,0 +1,273 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+from SubGraph import SubGraphEdge
+
+recordings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+graphs_dir = os.path.join(recordings_dir, 'graphs')
+
+MAGIC = b'SDRC'
+VERSION = 1
+# magic, version, worker count, keyframe interval, graph id (md5 hex)
+HEADER = struct.Struct('<4sHHI32s')
+# frame tag (b'F' delta frame, b'K' keyframe), step
+FRAME = struct.Struct('<cI')
+COUNT = struct.Struct('<I')
+
+RECORDING_ID = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def recording_path(recording_id):
+    if not RECORDING_ID.match(recording_id):
+        raise ValueError(f"Invalid recording id: {recording_id}")
+    return os.path.join(recordings_dir, f'{recording_id}.sdr')
+
+def pack_ids(ids):
+    return COUNT.pack(len(ids)) + struct.pack(f'<{len(ids)}I', *ids)
+
+def store_graph(graph_dict):
+    """Store the graph (geometry only) once under its content hash and return that hash as the graph ID."""
+    geometry = {
+        'nodes': graph_dict['nodes'],
+        'edges': [{k: v for k, v in e.items() if k != 'clean'} for e in graph_dict['edges']],
+        'bounds': graph_dict['bounds']
+    }
+    encoded = json.dumps(geometry).encode()
+    graph_id = hashlib.md5(encoded).hexdigest()
+
+    path = os.path.join(graphs_dir, f'{graph_id}.json')
+    if not os.path.exists(path):
+        os.makedirs(graphs_dir, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(tmp_path, path)
+    return graph_id
+
+def load_graph(graph_id):
+    with open(os.path.join(graphs_dir, f'{graph_id}.json'), 'r') as f:
+        return json.load(f)
+
+def list_recordings():
+    if not os.path.isdir(recordings_dir):
+        return []
+    return sorted(name[:-4] for name in os.listdir(recordings_dir) if name.endswith('.sdr'))
+
+
+class EpisodeRecorder:
+    """Appends a session to a compact binary log of integer node and edge IDs.
+
+    The log starts with a header pointing at the stored graph, then one frame per
+    step: worker node IDs plus the IDs of edges cleaned during that step. Every
+    `keyframe_interval` steps (and after every episode reset) a keyframe stores
+    the full set of clean edges instead, so playback can seek without replaying
+    from the start.
+    """
+
+    def __init__(self, world, recording_id, keyframe_interval=500):
+        self.world = world
+        self.recording_id = recording_id
+        self.path = recording_path(recording_id)
+        self.keyframe_interval = keyframe_interval
+
+        graph_dict = world.graph.to_dict()
+        # to_dict iterates the same sets in the same order, so list positions are the IDs
+        self.node_ids = {node: i for i, node in enumerate(world.graph.nodes)}
+        self.edge_ids = {id(edge): i for i, edge in enumerate(world.graph.edges)}
+        self.graph_id = store_graph(graph_dict)
+
+        self.cleaned: list[int] = []
+        self.last_keyframe = None
+
+        os.makedirs(recordings_dir, exist_ok=True)
+        self.file = open(self.path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(world.workers), keyframe_interval, self.graph_id.encode()))
+        self.record_step(0, keyframe=True)
+
+    def record_action(self, action):
+        """Note the edge a worker is about to traverse; only edges that are still dirty become events."""
+        if action is None:
+            return
+        edge = action[1].edge if isinstance(action[1], SubGraphEdge) else action[1]
+        if not edge.clean:
+            self.cleaned.append(self.edge_ids[id(edge)])
+
+    def record_step(self, step, keyframe=False):
+        if self.file.closed:
+            return
+
+        positions = [self.node_ids[w.position] for w in self.world.workers]
+        if keyframe or self.last_keyframe is None or step - self.last_keyframe >= self.keyframe_interval:
+            clean = [i for i, edge in enumerate(self.world.graph.edges) if edge.clean]
+            self.file.write(FRAME.pack(b'K', step) + struct.pack(f'<{len(positions)}I', *positions) + pack_ids(clean))
+            self.last_keyframe = step
+        else:
+            self.file.write(FRAME.pack(b'F', step) + struct.pack(f'<{len(positions)}I', *positions) + pack_ids(self.cleaned))
+        self.cleaned = []
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class RecordingPlayer:
+    """Reads a recording back and reconstructs worker positions and clean edges at any step."""
+
+    def __init__(self, recording_id):
+        with open(recording_path(recording_id), 'rb') as f:
+            self.data = f.read()
+
+        magic, version, self.num_workers, self.keyframe_interval, graph_id = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{recording_id} is not a version {VERSION} recording")
+        self.graph_id = graph_id.decode()
+        self.graph = load_graph(self.graph_id)
+
+        # Index frame offsets once; frames themselves are decoded on demand
+        self.frames: list[tuple[int, bool, int]] = []
+        self.steps: list[int] = []
+        self.keyframes: list[int] = []
+        offset = HEADER.size
+        positions_size = 4 * self.num_workers
+        while offset + FRAME.size <= len(self.data):
+            tag, step = FRAME.unpack_from(self.data, offset)
+            count_offset = offset + FRAME.size + positions_size
+            if count_offset + COUNT.size > len(self.data):
+                break  # truncated tail of a recording that is still being written
+            (count,) = COUNT.unpack_from(self.data, count_offset)
+            end = count_offset + COUNT.size + 4 * count
+            if end > len(self.data):
+                break
+            if tag == b'K':
+                self.keyframes.append(len(self.frames))
+            self.frames.append((step, tag == b'K', offset))
+            self.steps.append(step)
+            offset = end
+
+        self.index = -1
+        self.positions: list[int] = []
+        self.clean: set[int] = set()
+
+    def _decode(self, index):
+        step, _, offset = self.frames[index]
+        offset += FRAME.size
+        positions = struct.unpack_from(f'<{self.num_workers}I', self.data, offset)
+        offset += 4 * self.num_workers
+        (count,) = COUNT.unpack_from(self.data, offset)
+        ids = struct.unpack_from(f'<{count}I', self.data, offset + COUNT.size)
+        return step, positions, ids
+
+    def _apply(self, index):
+        _, is_keyframe, _ = self.frames[index]
+        _, positions, ids = self._decode(index)
+        self.positions = list(positions)
+        if is_keyframe:
+            self.clean = set(ids)
+        else:
+            self.clean.update(ids)
+        self.index = index
+
+    def step_count(self):
+        return self.frames[-1][0] if self.frames else 0
+
+    def current_step(self):
+        return self.frames[self.index][0] if self.index >= 0 else 0
+
+    def seek(self, step):
+        """Jump to the last frame at or before `step`, starting from the nearest keyframe."""
+        if not self.frames:
+            return
+        target = max(0, bisect.bisect_right(self.steps, step) - 1)
+
+        k = bisect.bisect_right(self.keyframes, target) - 1
+        start = self.keyframes[k] if k >= 0 else 0
+        if start <= self.index <= target:
+            start = self.index + 1  # already past that keyframe, keep going from here
+        for i in range(start, target + 1):
+            self._apply(i)
+
+    def advance(self, frames=1):
+        """Apply the next `frames` frames. Returns False once the end of the recording is reached."""
+        for _ in range(frames):
+            if self.index + 1 >= len(self.frames):
+                return False
+            self._apply(self.index + 1)
+        return True
+
+    def state_update(self):
+        """Same shape as TrainingSession.get_state_update, so the frontend renders replays like live runs."""
+        nodes = self.graph['nodes']
+        edges = [{**e, 'clean': i in self.clean} for i, e in enumerate(self.graph['edges'])]
+        return {
+            'edges': edges,
+            'workers': [nodes[i] for i in self.positions],
+            'progress': len(self.clean) / len(edges) if edges else 0.0,
+            'replay': {'step': self.current_step(), 'steps': self.step_count()}
+        }
+
+    def initial_state(self):
+        return {
+            'nodes': self.graph['nodes'],
+            'bounds': self.graph['bounds'],
+            **self.state_update()
+        }
+
+
+class ReplaySession:
+    """Streams a recording to one client at an adjustable speed, with seeking."""
+
+    def __init__(self, recording_id, speed=1.0, steps_per_second=100):
+        self.player = RecordingPlayer(recording_id)
+        self.recording_id = recording_id
+        self.speed = speed
+        self.steps_per_second = steps_per_second
+        self.is_running = False
+        self.lock = threading.Lock()
+
+    def seek(self, step):
+        with self.lock:
+            self.player.seek(step)
+
+    def set_speed(self, speed):
+        with self.lock:
+            self.speed = speed
+
+    def stop(self):
+        self.is_running = False
+
+    def initial_state(self):
+        with self.lock:
+            return self.player.initial_state()
+
+    def run(self, emit, update_interval):
+        """Advance playback every update_interval and hand each update to emit(event, data)."""
+        self.is_running = True
+        pending = 0.0
+        last_time = time.time()
+
+        while self.is_running:
+            time.sleep(update_interval)
+            now = time.time()
+
+            with self.lock:
+                # Recordings store one frame per simulation step; fractional frames carry over
+                pending += (now - last_time) * self.steps_per_second * self.speed
+                frames = int(pending)
+                pending -= frames
+                more = self.player.advance(frames) if frames > 0 else True
+                update = self.player.state_update()
+            last_time = now
+
+            emit('update', update)
+            if not more:
+                update['progress'] = 1.0
+                emit('final_state', update)
+                break
+
+        self.is_running = False
@@ -1,80 +1,193 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 import sys
 import os
-import osmnx as ox
-from osmnx import utils_geo, projection
 import threading
 import time
 import math
 import traceback
-import hashlib
+import itertools
 import json
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from Location import Location
+from Location import Location, CachedLocation, load_osmnx
 from World import World
 
-from constants import SIMULATION_UPDATE_INTERVAL, SIMULATION_STEP_DELAY
-from training_session import TrainingSession
-
-ox.settings.use_cache = True
-ox.settings.log_console = False
-# ox.settings.max_query_area_size = 25 * 1000 * 1000
+from constants import SIMULATION_UPDATE_INTERVAL, SIMULATION_STEP_DELAY, METRICS_PAYLOAD_SAMPLE_EVERY, REPLAY_STEPS_PER_SECOND, MAX_SIMULATION_SHARDS, SIMULATION_CONTRACT_ROADS, GRAPH_BUILD_WORKERS, GRAPH_JOB_RETENTION, GRAPH_REQUEST_TIMEOUT, GRAPH_CACHE_DISK_MB, GRAPH_CACHE_MEMORY_MB
+from training_session import TrainingSession, default_model_path, safe_name
+from sharded_session import ShardedSession
+from graph_jobs import GraphJobQueue
+from graph_cache import GraphCache, get_cache_key
+from snapshots import load_snapshot
+from model_pool import ModelPool
+from recording import ReplaySession, list_recordings
+from metrics import registry, graph_jobs_submitted, graph_cache_lookups, osmnx_fetch_seconds, emit_seconds, emit_payload_bytes
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 apiPrefix = '/api'
 
+class ThreadingTransport:
+    """How handlers and simulation threads reach clients under Flask-SocketIO. asgi.py swaps in the async server's."""
+
+    def emit(self, event, data, to):
+        socketio.emit(event, data, to=to)
+
+    def enter_room(self, sid, room):
+        socketio.server.enter_room(sid, room, namespace='/')
+
+    def leave_room(self, sid, room):
+        socketio.server.leave_room(sid, room, namespace='/')
+
+transport = ThreadingTransport()
+
 active_sessions = {}
+active_replays = {}
+pending_starts = {}
+# The session room each client gets updates from: its own simulation's, or one it is spectating
+watching = {}
+# Room of each running session. Named by the server, so clients that pick the same session_id never share one
+session_rooms = {}
+room_ids = itertools.count(1)
+model_pool = ModelPool(default_model_path)
+
+graph_cache = GraphCache(disk_budget=GRAPH_CACHE_DISK_MB * 1024 * 1024, memory_budget=GRAPH_CACHE_MEMORY_MB * 1024 * 1024)
 
-cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'cache')
-os.makedirs(cache_dir, exist_ok=True)
+def get_cached_graph(bounds):
+    result, lookup = graph_cache.get(bounds)
+    graph_cache_lookups.inc(result=lookup)
+    return result
+
+def fetch_location(bounds):
+    """Download the OSMnx graph for the bounds, recording how long it took."""
+    start_time = time.time()
+    location = Location(bounds=bounds)
+    osmnx_fetch_seconds.observe(time.time() - start_time)
+    return location
+
+def cache_graph(bounds, graph_dict):
+    return graph_cache.put(bounds, graph_dict)
+
+def graph_response(entry):
+    """Serve a cached graph byte-for-byte: 304 if the client already has it, gzip if it accepts it."""
+    etag = f'"{entry.etag}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = Response(entry.body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(entry.json_bytes(), mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
-def get_cache_key(bounds):
-    # Ensure bounds are properly formatted with full precision
-    if not bounds or len(bounds) != 4:
-        raise ValueError(f"Invalid bounds format: {bounds}")
+def build_graph(job, report):
+    """Graph job body: fetch from OSMnx, build the graph and cache it. Cache hits never get here."""
+    report('fetching', 0.1, 'Downloading road network from OpenStreetMap')
+    start_time = time.time()
+    location = fetch_location(job.bounds)
     
-    # Round to 6 decimal places (about 0.1m precision) to avoid floating point precision issues
-    # but keep enough precision to distinguish different locations
-    rounded_bounds = [round(float(b), 6) for b in bounds]
-    bounds_str = json.dumps(rounded_bounds, sort_keys=True)
-    cache_key = hashlib.md5(bounds_str.encode()).hexdigest()
+    report('building', 0.6, 'Building graph')
+    world = World(location, 0)
+    graph = world.graph
+    print(f"Graph created with {len(graph.nodes)} nodes and {len(graph.edges)} edges in {time.time() - start_time:.2f} seconds")
     
-    return cache_key
+    report('caching', 0.9, 'Caching graph')
+    # Keeps the sub graph partition with the graph so sessions on these bounds skip generate_sub_graphs
+    return cache_graph(job.bounds, world.to_dict())
 
-def get_cached_graph(bounds):
-    cache_key = get_cache_key(bounds)
-    cache_file = os.path.join(cache_dir, f'{cache_key}.json')
+def notify_graph_job(job):
+    for sid in list(job.subscribers):
+        transport.emit('graph_job', job.to_dict(), to=sid)
+
+graph_jobs = GraphJobQueue(build_graph, max_workers=GRAPH_BUILD_WORKERS, retention=GRAPH_JOB_RETENTION)
+graph_jobs.notify = notify_graph_job
+
+def open_room(session):
+    room = session_rooms[session] = f'session:{next(room_ids)}'
+    return room
+
+def watch(client_sid, room):
+    """Move the client into a session's room. Updates are encoded once per room, however many clients are in it."""
+    previous = watching.get(client_sid)
+    if previous == room:
+        return
+    if previous is not None:
+        transport.leave_room(client_sid, previous)
+    transport.enter_room(client_sid, room)
+    watching[client_sid] = room
+
+def find_session(session_id, exclude_sid=None):
+    """The running session with this id, ignoring the one exclude_sid owns, or None."""
+    return next((s for sid, s in list(active_sessions.items()) if s.session_id == session_id and sid != exclude_sid), None)
+
+def session_starting(session_id, exclude_sid=None):
+    return any(token['session_id'] == session_id for sid, token in list(pending_starts.items()) if sid != exclude_sid)
+
+def request_graph(bounds, force_refresh=False, subscriber=None):
+    """(cache entry, None) on a cache hit, else (None, job) for the shared build of these bounds."""
+    if not force_refresh:
+        cached_result = get_cached_graph(bounds)
+        if cached_result:
+            return cached_result, None
     
-    if os.path.exists(cache_file):
-        try:
-            print(f"Cache hit! Using cache file: {cache_key}.json for bounds: {bounds}")
-            with open(cache_file, 'r') as f:
-                return json.load(f)
-        except (IOError, json.JSONDecodeError) as e:
-            print(f"Cache read error: {e}")
-            pass
-    else:
-        print(f"Cache miss! No cache file found for bounds: {bounds} (cache key: {cache_key})")
-    return None
+    job, created = graph_jobs.submit(get_cache_key(bounds), bounds, force_refresh, subscriber)
+    graph_jobs_submitted.inc(result='started' if created else 'deduplicated')
+    if not created:
+        print(f"Joining graph job {job.id} already building bounds: {bounds}")
+    return None, job
 
-def cache_graph(bounds, graph_dict):
-    cache_key = get_cache_key(bounds)
-    cache_file = os.path.join(cache_dir, f'{cache_key}.json')
+def collect_session_metrics():
+    sessions = list(active_sessions.values())
     
-    try:
-        with open(cache_file, 'w') as f:
-            json.dump(graph_dict, f)
-        print(f"Graph cached successfully to: {cache_key}.json for bounds: {bounds}")
-        print(f"Cache file size: {os.path.getsize(cache_file) / 1024 / 1024:.2f} MB")
-    except (IOError, OSError) as e:
-        print(f"Cache write error: {e}")
-        pass
+    def per_session(value):
+        return [({'session': s.session_id}, value(s)) for s in sessions]
+    
+    agent_sessions = [s for s in sessions if s.agent is not None and not s.eval_mode]
+    
+    def per_agent(value):
+        return [({'session': s.session_id}, value(s.agent)) for s in agent_sessions]
+    
+    phases = [
+        ({'session': s.session_id, 'phase': phase, 'quantile': q}, stats[key] / 1000)
+        for s in sessions
+        for phase, stats in s.timings.summary().items()
+        for q, key in (('0.5', 'p50_ms'), ('0.9', 'p90_ms'), ('0.99', 'p99_ms'))
+    ]
+    
+    cache_stats = graph_cache.stats()
+    rooms = list(watching.values())
+    
+    return [
+        ('snowyday_active_sessions', 'gauge', 'Simulation sessions currently running.', [({}, len(sessions))]),
+        ('snowyday_session_steps_total', 'counter', 'Simulation steps taken by each session.', per_session(lambda s: s.step_count)),
+        ('snowyday_session_steps_per_second', 'gauge', 'Recent simulation throughput of each session.', per_session(lambda s: s.steps_per_second())),
+        ('snowyday_session_viewers', 'gauge', 'Clients receiving each session\'s updates, its owner included.', per_session(lambda s: rooms.count(session_rooms.get(s)))),
+        ('snowyday_session_phase_seconds', 'summary', 'Recent duration of each step and emit phase.', phases),
+        ('snowyday_replay_buffer_transitions', 'gauge', 'Transitions held in each session\'s replay buffer.', per_agent(lambda a: len(a.replay))),
+        ('snowyday_replay_buffer_bytes', 'gauge', 'Approximate memory held by each session\'s replay buffer.', per_agent(lambda a: a.replay_memory_bytes())),
+        ('snowyday_checkpoint_saves_total', 'counter', 'Model checkpoints written by each session.', per_agent(lambda a: a.checkpoints.save_count)),
+        ('snowyday_checkpoint_skipped_total', 'counter', 'Checkpoints superseded before the writer got to them.', per_agent(lambda a: a.checkpoints.skipped)),
+        ('snowyday_checkpoint_copy_seconds_total', 'counter', 'Time the training thread spent copying weights for checkpoints.', per_agent(lambda a: a.checkpoints.copy_seconds_total)),
+        ('snowyday_checkpoint_write_seconds_total', 'counter', 'Time the background writer spent writing model checkpoints.', per_agent(lambda a: a.checkpoints.write_seconds_total)),
+        ('snowyday_checkpoint_last_write_seconds', 'gauge', 'Duration of the most recent model checkpoint write.', per_agent(lambda a: a.checkpoints.last_write_seconds)),
+        ('snowyday_graph_cache_entries', 'gauge', 'Graph cache entries by tier.', [({'tier': 'disk'}, cache_stats['entries']), ({'tier': 'memory'}, cache_stats['hot_entries'])]),
+        ('snowyday_graph_cache_bytes', 'gauge', 'Compressed bytes held by the graph cache by tier.', [({'tier': 'disk'}, cache_stats['disk_bytes']), ({'tier': 'memory'}, cache_stats['hot_bytes'])]),
+    ]
+
+registry.add_collector(collect_session_metrics)
+
+@app.route(f'{apiPrefix}/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route(f'{apiPrefix}/recordings', methods=['GET'])
+def get_recordings():
+    return jsonify({'recordings': list_recordings()})
 
 @app.route(f'{apiPrefix}/graph', methods=['POST'])
 def get_graph():
@@ -91,6 +204,9 @@ def get_graph():
             
         min_lat, max_lat, min_lon, max_lon = bounds
         
+        from osmnx import utils_geo, projection
+        load_osmnx()
+        
         bbox = (min_lon, min_lat, max_lon, max_lat)
         
         polygon = utils_geo.bbox_to_poly(bbox)
@@ -114,29 +230,26 @@ def get_graph():
                 'max_allowed': MAX_AREA_KM2
             }), 400
         
-        # Check cache unless force_refresh is True
-        if not force_refresh:
-            cached_result = get_cached_graph(bounds)
-            if cached_result:
-                print(f"Returning cached graph for bounds: {bounds}")
-                return jsonify(cached_result)
-        else:
+        if force_refresh:
             print(f"Force refresh requested - bypassing cache for bounds: {bounds}")
         
-        print(f"Fetching NEW graph for bounds: {bounds} (Geographic area: {geographic_area_km2:.2f} km², Projected area: {projected_area_km2:.2f} km²)")
-        print(f"Bounds details: min_lat={min_lat}, max_lat={max_lat}, min_lon={min_lon}, max_lon={max_lon}")
-        start_time = time.time()
+        # Checks the cache unless force_refresh is True; otherwise joins or starts the build for these bounds
+        cached_result, job = request_graph(bounds, force_refresh, subscriber=data.get('socket_id'))
+        if cached_result is not None:
+            print(f"Returning cached graph for bounds: {bounds}")
+            return graph_response(cached_result)
         
-        location = Location(bounds=bounds)
-        world = World(location, 0)
-
-        graph = world.graph
-        print(f"Graph created with {len(graph.nodes)} nodes and {len(graph.edges)} edges in {time.time() - start_time:.2f} seconds")
+        print(f"Graph job {job.id} for bounds: {bounds} (Geographic area: {geographic_area_km2:.2f} km², Projected area: {projected_area_km2:.2f} km²)")
+        print(f"Bounds details: min_lat={min_lat}, max_lat={max_lat}, min_lon={min_lon}, max_lon={max_lon}")
         
-        result = graph.to_dict()
-        cache_graph(bounds, result)
+        # Async callers get the job straight away and follow it over the socket or /api/graph/jobs/<id>
+        if data.get('async', False):
+            return jsonify(job.to_dict()), 202
         
-        return jsonify(result)
+        try:
+            return graph_response(job.wait(GRAPH_REQUEST_TIMEOUT))
+        except TimeoutError:
+            return jsonify(job.to_dict()), 202
         
     except Exception as e:
         error_trace = traceback.format_exc()
@@ -144,41 +257,129 @@ def get_graph():
         print(f"Traceback: {error_trace}")
         return jsonify({'error': str(e), 'traceback': error_trace}), 500
 
-@socketio.on('start_simulation')
-def handle_start_simulation(data):
-    
+@app.route(f'{apiPrefix}/graph/jobs/<job_id>', methods=['GET'])
+def get_graph_job(job_id):
+    job = graph_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown graph job: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route(f'{apiPrefix}/graph/jobs/<job_id>/result', methods=['GET'])
+def get_graph_job_result(job_id):
+    job = graph_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown graph job: {job_id}'}), 404
+    if not job.is_done():
+        return jsonify(job.to_dict()), 202
+    if job.error is not None:
+        return jsonify(job.to_dict()), 500
+    return graph_response(job.result)
+
+def handle_subscribe_graph_job(client_sid, data=None):
+    data = data or {}
+    job = graph_jobs.subscribe(data.get('job_id'), client_sid)
+    if job is None:
+        transport.emit('error', {'message': f"Unknown graph job: {data.get('job_id')}"}, to=client_sid)
+    else:
+        transport.emit('graph_job', job.to_dict(), to=client_sid)
+
+def handle_start_simulation(client_sid, data=None):
+    data = data or {}
     try:
         bounds = data.get('bounds')
         num_workers = data.get('num_workers', 10)
         session_id = data.get('session_id', f'session_{time.time()}')
-        client_sid = request.sid
         
         if not bounds or len(bounds) != 4:
-            emit('error', {'message': 'Invalid bounds. Expected [min_lat, max_lat, min_lon, max_lon]'})
+            transport.emit('error', {'message': 'Invalid bounds. Expected [min_lat, max_lat, min_lon, max_lon]'}, to=client_sid)
+            return
+        
+        eval_mode = data.get('eval_mode', False)
+        planner_mode = data.get('planner_mode', False)
+        profile = data.get('profile', False)
+        record = data.get('record', False)
+        resume = data.get('resume', False)
+        num_shards = min(int(data.get('shards', 1)), MAX_SIMULATION_SHARDS)
+        contract = data.get('contract_roads', SIMULATION_CONTRACT_ROADS)
+        
+        if num_shards > 1 and not (eval_mode or planner_mode):
+            transport.emit('error', {'message': 'Sharded simulations only run evaluation or the planner; set eval_mode or planner_mode, or use one shard to train'}, to=client_sid)
+            return
+        
+        # Another client's session with this id would share its snapshot and replay files
+        if find_session(session_id, exclude_sid=client_sid) is not None or session_starting(session_id, exclude_sid=client_sid):
+            transport.emit('error', {'message': f'Session {session_id} is already running; stop it first or watch it with watch_session'}, to=client_sid)
             return
         
         if client_sid in active_sessions:
             active_sessions[client_sid].stop()
             del active_sessions[client_sid]
+        mode_str = "planner baseline" if planner_mode else "DQN evaluation" if eval_mode else "DQN training"
+        print(f"Starting {mode_str} simulation for session {session_id} with {num_workers} workers")
         
-        eval_mode = data.get('eval_mode', False)
-        mode_str = "evaluation" if eval_mode else "training"
-        print(f"Starting DQN {mode_str} simulation for session {session_id} with {num_workers} workers")
-        
-        location = Location(bounds=bounds)
-        world = World(location, num_workers)
-        
-        training_session = TrainingSession(world, session_id, num_workers, eval_mode=eval_mode)
-        active_sessions[client_sid] = training_session
+        cached_graph, job = request_graph(bounds, subscriber=client_sid)
+        if job is not None:
+            transport.emit('graph_job', job.to_dict(), to=client_sid)
         
-        initial_state = training_session.get_initial_state()
-        emit('initial_state', initial_state)
+        # Newer starts (or a stop/disconnect) while the graph builds cancel this one
+        start_token = {'session_id': session_id}
+        pending_starts[client_sid] = start_token
         
         def run_training():
+            try:
+                graph_dict = (cached_graph if cached_graph is not None else job.wait()).graph()
+                if pending_starts.get(client_sid) is not start_token:
+                    print(f"Simulation start for session {session_id} was superseded while its graph was building")
+                    return
+                
+                location = CachedLocation(graph_dict)
+                world = World(location, num_workers, location.node_groups, contract=contract)
+                
+                if num_shards > 1:
+                    training_session = ShardedSession(world, session_id, num_workers, num_shards, planner_mode=planner_mode)
+                else:
+                    initial_weights = None if planner_mode else model_pool.get()
+                    # Without a client-chosen session_id nobody can resume the session, so its replay buffer goes when it stops
+                    training_session = TrainingSession(world, session_id, num_workers, eval_mode=eval_mode, planner_mode=planner_mode, initial_weights=initial_weights, record=record, keep_replay='session_id' in data)
+                # The start stays pending (and its session_id taken) until the session is registered
+                if pending_starts.get(client_sid) is not start_token:
+                    print(f"Simulation start for session {session_id} was superseded while its world was building")
+                    training_session.stop()
+                    return
+                active_sessions[client_sid] = training_session
+                pending_starts.pop(client_sid, None)
+                room = open_room(training_session)
+                watch(client_sid, room)
+                
+                # A client that reconnects with the same session_id picks its training back up
+                if resume and num_shards <= 1 and not (eval_mode or planner_mode):
+                    snapshot = load_snapshot(safe_name(session_id))
+                    if snapshot is None:
+                        print(f"No snapshot to resume for session {session_id}, starting fresh")
+                    elif training_session.restore(snapshot):
+                        print(f"Resumed session {session_id} at episode {training_session.episode}, step {training_session.step_count}")
+                        transport.emit('simulation_resumed', {'message': 'Simulation resumed from snapshot', 'step_count': training_session.step_count}, to=client_sid)
+                    else:
+                        print(f"Snapshot for session {session_id} was taken on a different map, worker count or network shape, starting fresh")
+                
+                initial_state = training_session.get_initial_state()
+                transport.emit('initial_state', initial_state, to=client_sid)
+            except Exception as e:
+                if pending_starts.get(client_sid) is start_token:
+                    pending_starts.pop(client_sid, None)
+                error_trace = traceback.format_exc()
+                print(f"Error in start_simulation: {str(e)}")
+                print(f"Traceback: {error_trace}")
+                transport.emit('error', {'message': str(e), 'traceback': error_trace}, to=client_sid)
+                return
+            
             update_interval = SIMULATION_UPDATE_INTERVAL
             last_update = time.time()
+            emit_count = 0
             
             training_session.start()
+            if profile:
+                training_session.start_profiler()
             
             while training_session.is_running:
                 should_continue = training_session.step()
@@ -188,22 +389,39 @@ def handle_start_simulation(data):
                 
                 current_time = time.time()
                 if current_time - last_update >= update_interval:
+                    t0 = time.perf_counter()
                     update_data = training_session.get_state_update()
-                    socketio.emit('update', update_data, room=client_sid)
+                    t1 = time.perf_counter()
+                    transport.emit('update', update_data, to=room)
+                    t2 = time.perf_counter()
+                    training_session.timings.record('serialize', t1 - t0)
+                    training_session.timings.record('emit', t2 - t1)
+                    emit_seconds.observe(t2 - t1)
+                    
+                    emit_count += 1
+                    if emit_count % METRICS_PAYLOAD_SAMPLE_EVERY == 1:
+                        emit_payload_bytes.observe(len(json.dumps(update_data)))
                     last_update = current_time
                 
                 time.sleep(SIMULATION_STEP_DELAY)
             
             final_state = training_session.get_state_update()
             final_state['progress'] = 1.0
-            socketio.emit('final_state', final_state, room=client_sid)
+            transport.emit('final_state', final_state, to=room)
+            session_rooms.pop(training_session, None)
             
+            training_session.stop()
             if client_sid in active_sessions:
                 del active_sessions[client_sid]
             
             print(f"Training completed for session {session_id}")
             metrics = training_session.get_training_metrics()
-            print(f"Final metrics: steps={metrics['step_count']}, reward={metrics['total_reward']}, epsilon={metrics['epsilon']:.4f}")
+            if num_shards > 1:
+                print(f"Final metrics: steps={metrics['step_count']}, shards={metrics['shards']}, handoffs={metrics['handoffs']}")
+            elif planner_mode:
+                print(f"Final metrics: steps={metrics['step_count']}, reward={metrics['total_reward']}, planning_time={metrics['planning_time']:.2f}s")
+            else:
+                print(f"Final metrics: steps={metrics['step_count']}, reward={metrics['total_reward']}, epsilon={metrics['epsilon']:.4f}")
         
         thread = threading.Thread(target=run_training, daemon=True)
         thread.start()
@@ -212,54 +430,182 @@ def handle_start_simulation(data):
         error_trace = traceback.format_exc()
         print(f"Error in start_simulation: {str(e)}")
         print(f"Traceback: {error_trace}")
-        emit('error', {'message': str(e), 'traceback': error_trace})
+        transport.emit('error', {'message': str(e), 'traceback': error_trace}, to=client_sid)
 
 
-@socketio.on('stop_simulation')
-def handle_stop_simulation(data=None):
-    client_sid = request.sid
+def handle_watch_session(client_sid, data=None):
+    """Spectate a running session: the client gets its full state now and the same updates as its owner from then on."""
+    session_id = (data or {}).get('session_id')
+    session = find_session(session_id)
+    room = session_rooms.get(session)
+    if room is None:
+        transport.emit('error', {'message': f'No running session: {session_id}'}, to=client_sid)
+        return
+    
+    watch(client_sid, room)
+    transport.emit('initial_state', session.get_initial_state(), to=client_sid)
+
+
+def handle_unwatch_session(client_sid, data=None):
+    room = watching.pop(client_sid, None)
+    if room is not None:
+        transport.leave_room(client_sid, room)
+
+
+def handle_stop_simulation(client_sid, data=None):
+    
+    if pending_starts.pop(client_sid, None) is not None:
+        transport.emit('simulation_stopped', {'message': 'Simulation start cancelled'}, to=client_sid)
+        return
     
     if client_sid in active_sessions:
         session = active_sessions[client_sid]
         session.stop()
         print(f"Stopped simulation for client {client_sid}")
-        emit('simulation_stopped', {'message': 'Simulation stopped'})
+        transport.emit('simulation_stopped', {'message': 'Simulation stopped'}, to=client_sid)
     else:
-        emit('error', {'message': 'No active simulation to stop'})
+        transport.emit('error', {'message': 'No active simulation to stop'}, to=client_sid)
 
 
-@socketio.on('pause_simulation')
-def handle_pause_simulation(data=None):
-    client_sid = request.sid
+def handle_pause_simulation(client_sid, data=None):
     
     if client_sid in active_sessions:
         session = active_sessions[client_sid]
         session.pause()
-        emit('simulation_paused', {'message': 'Simulation paused'})
+        transport.emit('simulation_paused', {'message': 'Simulation paused'}, to=client_sid)
     else:
-        emit('error', {'message': 'No active simulation to pause'})
+        transport.emit('error', {'message': 'No active simulation to pause'}, to=client_sid)
 
 
-@socketio.on('resume_simulation')
-def handle_resume_simulation(data=None):
-    client_sid = request.sid
+def handle_resume_simulation(client_sid, data=None):
     
     if client_sid in active_sessions:
         session = active_sessions[client_sid]
         session.resume()
-        emit('simulation_resumed', {'message': 'Simulation resumed'})
+        transport.emit('simulation_resumed', {'message': 'Simulation resumed'}, to=client_sid)
+    else:
+        transport.emit('error', {'message': 'No active simulation to resume'}, to=client_sid)
+
+
+def handle_start_profiling(client_sid, data=None):
+    
+    if client_sid in active_sessions:
+        session = active_sessions[client_sid]
+        if session.start_profiler():
+            transport.emit('profiling_started', {'message': 'Profiler started'}, to=client_sid)
+        else:
+            transport.emit('error', {'message': 'Profiler is already running or the simulation has not started'}, to=client_sid)
     else:
-        emit('error', {'message': 'No active simulation to resume'})
+        transport.emit('error', {'message': 'No active simulation to profile'}, to=client_sid)
 
 
-@socketio.on('disconnect')
-def handle_disconnect():
-    client_sid = request.sid
+def handle_stop_profiling(client_sid, data=None):
+    
+    if client_sid in active_sessions:
+        session = active_sessions[client_sid]
+        output_path = session.stop_profiler()
+        if output_path is not None:
+            transport.emit('profiling_stopped', {'message': 'Profiler stopped', 'path': output_path}, to=client_sid)
+        else:
+            transport.emit('error', {'message': 'Profiler is not running'}, to=client_sid)
+    else:
+        transport.emit('error', {'message': 'No active simulation to profile'}, to=client_sid)
+
+
+def handle_start_replay(client_sid, data=None):
+    data = data or {}
+    try:
+        recording_id = data.get('recording_id')
+        speed = float(data.get('speed', 1.0))
+        start_step = int(data.get('start_step', 0))
+        
+        if not recording_id:
+            transport.emit('error', {'message': 'No recording_id given'}, to=client_sid)
+            return
+        
+        if client_sid in active_replays:
+            active_replays[client_sid].stop()
+        
+        replay = ReplaySession(recording_id, speed=speed, steps_per_second=REPLAY_STEPS_PER_SECOND)
+        replay.seek(start_step)
+        active_replays[client_sid] = replay
+        print(f"Starting replay of {recording_id} for client {client_sid} at {speed}x")
+        
+        transport.emit('initial_state', replay.initial_state(), to=client_sid)
+        
+        def run_replay():
+            replay.run(lambda event, update: transport.emit(event, update, to=client_sid), SIMULATION_UPDATE_INTERVAL)
+            if active_replays.get(client_sid) is replay:
+                del active_replays[client_sid]
+        
+        thread = threading.Thread(target=run_replay, daemon=True)
+        thread.start()
+        
+    except (ValueError, FileNotFoundError) as e:
+        transport.emit('error', {'message': f'Cannot replay recording: {e}'}, to=client_sid)
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        print(f"Error in start_replay: {str(e)}")
+        print(f"Traceback: {error_trace}")
+        transport.emit('error', {'message': str(e), 'traceback': error_trace}, to=client_sid)
+
+
+def handle_seek_replay(client_sid, data=None):
+    data = data or {}
+    
+    if client_sid in active_replays:
+        replay = active_replays[client_sid]
+        if 'speed' in data:
+            replay.set_speed(float(data['speed']))
+        if 'step' in data:
+            replay.seek(int(data['step']))
+    else:
+        transport.emit('error', {'message': 'No active replay to seek'}, to=client_sid)
+
+
+def handle_stop_replay(client_sid, data=None):
+    
+    if client_sid in active_replays:
+        active_replays.pop(client_sid).stop()
+        transport.emit('replay_stopped', {'message': 'Replay stopped'}, to=client_sid)
+    else:
+        transport.emit('error', {'message': 'No active replay to stop'}, to=client_sid)
+
+
+def handle_disconnect(client_sid, data=None):
+    pending_starts.pop(client_sid, None)
+    watching.pop(client_sid, None)
+    graph_jobs.unsubscribe_all(client_sid)
     
     if client_sid in active_sessions:
         active_sessions[client_sid].stop()
         del active_sessions[client_sid]
         print(f"Client {client_sid} disconnected, stopped their simulation")
+    
+    if client_sid in active_replays:
+        active_replays.pop(client_sid).stop()
+
+# Socket events by name. Handlers take the client's sid and the event data, so the async server can share them
+socket_handlers = {
+    'subscribe_graph_job': handle_subscribe_graph_job,
+    'start_simulation': handle_start_simulation,
+    'watch_session': handle_watch_session,
+    'unwatch_session': handle_unwatch_session,
+    'stop_simulation': handle_stop_simulation,
+    'pause_simulation': handle_pause_simulation,
+    'resume_simulation': handle_resume_simulation,
+    'start_profiling': handle_start_profiling,
+    'stop_profiling': handle_stop_profiling,
+    'start_replay': handle_start_replay,
+    'seek_replay': handle_seek_replay,
+    'stop_replay': handle_stop_replay,
+    'disconnect': handle_disconnect
+}
+
+for event, handler in socket_handlers.items():
+    socketio.on_event(event, lambda data=None, handler=handler: handler(request.sid, data))
 
 if __name__ == '__main__':
+    # Load torch and the model weights in the background while the server starts accepting requests
+    model_pool.warm_async()
     socketio.run(app, debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import threading
+import time
+import os
+import sys
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sharding import ShardedSimulation
+from api.constants import PROFILE_WINDOW
+from api.profiler import PhaseTimer
+from api.training_session import default_model_path
+
+
+class ShardedSession:
+    """Runs a World as a ShardedSimulation behind the TrainingSession interface the server loop uses.
+
+    Shards act with the route planner or the trained model in inference mode;
+    training stays in single-process sessions. Opt-in through start_simulation's
+    'shards' option: the per-step barrier and shared-memory sync cost more than
+    they save unless the map is large and its workers are spread across shards.
+    """
+
+    def __init__(self, world, session_id, num_workers, num_shards, planner_mode=False, model_path=None):
+        self.world = world
+        self.session_id = session_id
+        self.num_workers = num_workers
+        self.num_shards = num_shards
+        self.eval_mode = not planner_mode
+        self.planner_mode = planner_mode
+        self.agent = None
+        self.is_running = False
+        self.is_paused = False
+        self.lock = threading.Lock()
+        self.total_reward = 0
+        self.episode_reward = 0
+        self.step_count = 0
+        self.episode = 0
+        self.timings = PhaseTimer(PROFILE_WINDOW)
+        self.step_times = deque(maxlen=PROFILE_WINDOW)
+
+        policy = 'planner' if planner_mode else (model_path or default_model_path)
+        self.simulation = ShardedSimulation(world, num_shards, policy=policy)
+
+    def step(self):
+        """Advance every shard one step. Returns True if simulation should continue."""
+        if not self.is_running or self.is_paused:
+            return False
+
+        step_start = time.perf_counter()
+        should_continue = self.simulation.step()
+        self.step_count += 1
+        self.step_times.append(time.time())
+        self.timings.record('step', time.perf_counter() - step_start)
+        return should_continue
+
+    def start(self):
+        with self.lock:
+            # Spawns the shard processes; they rebuild the graph before the first step returns
+            self.simulation.start()
+            self.is_running = True
+            self.is_paused = False
+
+    def stop(self):
+        with self.lock:
+            self.is_running = False
+        self.simulation.stop()
+
+    def start_profiler(self):
+        return False
+
+    def stop_profiler(self):
+        return None
+
+    def pause(self):
+        with self.lock:
+            self.is_paused = True
+
+    def resume(self):
+        with self.lock:
+            self.is_paused = False
+
+    def steps_per_second(self):
+        step_times = list(self.step_times)
+        if len(step_times) < 2 or step_times[-1] == step_times[0]:
+            return 0.0
+        return (len(step_times) - 1) / (step_times[-1] - step_times[0])
+
+    def get_state_update(self):
+        """Unified view of all shards; step() has already synced their clean flags and workers into the World."""
+        graph = self.world.graph
+        return {
+            'edges': graph.to_dict()['edges'],
+            'workers': graph.get_workers_dict(self.world.workers),
+            'progress': self.simulation.clean_ratio(),
+            'training': self.get_training_metrics()
+        }
+
+    def get_initial_state(self):
+        graph = self.world.graph
+        return {
+            **graph.to_dict(),
+            'workers': graph.get_workers_dict(self.world.workers),
+            'progress': graph.clean_ratio(),
+            'training': self.get_training_metrics()
+        }
+
+    def get_training_metrics(self):
+        return {
+            'episode': self.episode,
+            'total_reward': self.total_reward,
+            'episode_reward': self.episode_reward,
+            'step_count': self.step_count,
+            'eval_mode': self.eval_mode,
+            'planner_mode': self.planner_mode,
+            'profiling': False,
+            'recording': None,
+            'timings': self.timings.summary(),
+            **self.simulation.get_metrics()
+        }
@@ -0,0 +1,64 @@
+import os
+
+sessions_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions')
+
+
+def snapshot_path(name, directory=sessions_dir):
+    return os.path.join(directory, f'{name}.pth')
+
+def capture_world(world):
+    """Clean edges and worker placement, keyed by coordinates so they map onto a freshly built World."""
+    return {
+        'clean_edges': [(e.start.x, e.start.y, e.end.x, e.end.y) for e in world.graph.edges if e.clean],
+        'workers': [
+            {'x': w.position.x, 'y': w.position.y, 'sub_graph': w.sub_graph.id}
+            for w in world.workers
+        ]
+    }
+
+def restore_world(world, state):
+    """Apply a capture_world() snapshot. Returns False (leaving the world untouched) if it doesn't fit this world."""
+    if len(state['workers']) != len(world.workers):
+        return False
+
+    nodes = {(n.x, n.y): n for n in world.graph.nodes}
+    sub_graphs = {s.id: s for s in world.sub_graphs}
+    placements = []
+    for worker_state in state['workers']:
+        node = nodes.get((worker_state['x'], worker_state['y']))
+        if node is None:
+            return False
+        sub_graph = sub_graphs.get(worker_state['sub_graph'])
+        if sub_graph is None or node not in sub_graph.nodes:
+            sub_graph = next((s for s in world.sub_graphs if node in s.nodes), None)
+            if sub_graph is None:
+                return False
+        placements.append((node, sub_graph))
+
+    clean = {tuple(row) for row in state['clean_edges']}
+    for edge in world.graph.edges:
+        edge.clean = (edge.start.x, edge.start.y, edge.end.x, edge.end.y) in clean
+
+    for worker, (node, sub_graph) in zip(world.workers, placements):
+        worker.position = node
+        worker.sub_graph = sub_graph
+    for worker in world.workers:
+        worker.setup_worker()
+    return True
+
+def save_snapshot(name, snapshot, directory=sessions_dir):
+    """Write the snapshot on the background checkpoint writer; a newer one replaces it if it hasn't been written yet."""
+    # Only training sessions take snapshots, and they have already imported torch
+    from Checkpoint import atomic_save, get_writer
+
+    path = snapshot_path(name, directory)
+    get_writer().submit(path, lambda: atomic_save(snapshot, path))
+
+def load_snapshot(name, directory=sessions_dir):
+    """The session's latest snapshot, or None if there isn't one."""
+    path = snapshot_path(name, directory)
+    if not os.path.exists(path):
+        return None
+
+    import torch
+    return torch.load(path, map_location='cpu', weights_only=True)
@@ -1,28 +1,69 @@
 import threading
 import time
 import os
+import re
+import shutil
 import sys
+from collections import deque
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from Agent import DQNAgent
-from SubGraph import Y_RANGE
-from api.constants import MODEL_SAVE_INTERVAL, TRAINING_BATCH_SIZE, TRAINING_BUFFER_SIZE
+from Planner import RoutePlanner
+from SubGraph import Y_RANGE, MAX_ACTIONS, MODEL_FILE
+from api.constants import MODEL_SAVE_INTERVAL, CHECKPOINT_VERSION_EVERY, CHECKPOINT_KEEP, TRAINING_BATCH_SIZE, TRAINING_BUFFER_SIZE, TRAINING_REPLAY_ON_DISK, TRAINING_REPLAY_DISK_MB, TRAINING_REPLAY_TOTAL_DISK_MB, TRAINING_REPLAY_STATE_DTYPE, TRAINING_PRIORITIZED_REPLAY, TRAINING_PRIORITY_ALPHA, TRAINING_PRIORITY_BETA, TRAINING_PRIORITY_BETA_STEPS, INFERENCE_SNAPSHOT_INTERVAL, PROFILE_WINDOW, PROFILE_SAMPLE_INTERVAL, RECORDING_KEYFRAME_INTERVAL, SESSION_SNAPSHOT_INTERVAL
+from api.profiler import PhaseTimer, SamplingProfiler
+from api.recording import EpisodeRecorder
+from api.snapshots import capture_world, restore_world, save_snapshot, sessions_dir
 
+profiles_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+replay_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replay')
+default_model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), MODEL_FILE)
+
+
+def safe_name(session_id):
+    """Session IDs come from the client; keep them usable as file names."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)
+
+def prune_replay_dirs(budget, root=replay_dir):
+    """Delete the least recently flushed replay buffers no session has open until root fits in budget bytes."""
+    from ReplayBuffer import MemmapReplayBuffer
+
+    if not os.path.isdir(root):
+        return
+    directories = []
+    for entry in os.scandir(root):
+        if entry.is_dir():
+            meta_path = os.path.join(entry.path, 'meta.json')
+            used = os.path.getmtime(meta_path) if os.path.exists(meta_path) else entry.stat().st_mtime
+            directories.append((used, entry.path, MemmapReplayBuffer.disk_bytes(entry.path)))
+
+    total = sum(size for _, _, size in directories)
+    for _, path, size in sorted(directories):
+        if total <= budget:
+            break
+        if MemmapReplayBuffer.is_open(path):
+            continue
+        print(f"Deleting replay buffer {path} ({size / 1024 / 1024:.0f} MB) to stay within the replay disk budget")
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
 
 def compute_state_dim():
     """Compute state dimension based on SubGraph parameters."""
-    return (Y_RANGE ** 2) * 6 + 100 * 2 + 4 * 2
+    return (Y_RANGE ** 2) * 6 + 100 * 2 + MAX_ACTIONS * 2
 
 
 class TrainingSession:
     """Thread-safe manager for a single DQN training session."""
 
-    def __init__(self, world, session_id, num_workers, eval_mode=False):
+    def __init__(self, world, session_id, num_workers, eval_mode=False, planner_mode=False, model_path=None, initial_weights=None, record=False, keep_replay=True, replay_root=replay_dir, snapshot_dir=sessions_dir):
         self.world = world
         self.session_id = session_id
+        # Whether the on-disk replay buffer outlives the session; only worth it if the client can resume by session_id
+        self.keep_replay = keep_replay
+        self.snapshot_dir = snapshot_dir
         self.num_workers = num_workers
         self.eval_mode = eval_mode
+        self.planner_mode = planner_mode
         self.is_running = False
         self.is_paused = False
         self.lock = threading.Lock()
@@ -30,58 +71,151 @@ class TrainingSession:
         self.episode_reward = 0
         self.step_count = 0
         self.episode = 0
+        self.timings = PhaseTimer(PROFILE_WINDOW)
+        self.step_times = deque(maxlen=PROFILE_WINDOW)
+        self.profiler = None
+        self.thread_id = None
 
-        model_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-            'model_eval.pth'
-        )
+        for worker in self.world.workers:
+            worker.setup_worker()
+
+        self.recorder = None
+        if record:
+            recording_id = safe_name(f'{session_id}_{int(time.time())}')
+            self.recorder = EpisodeRecorder(self.world, recording_id, RECORDING_KEYFRAME_INTERVAL)
+
+        # Planner sessions are a non-RL baseline: no network, optimizer or replay buffer is built
+        if planner_mode:
+            self.agent = None
+            self.planner = RoutePlanner(self.world)
+            return
+
+        self.planner = None
+        if model_path is None:
+            model_path = default_model_path
+
+        # Imported here so planner sessions and server startup don't pay for importing torch
+        from Agent import DQNAgent, InferenceAgent
 
         state_dim = compute_state_dim()
+        if TRAINING_REPLAY_ON_DISK and not eval_mode:
+            # Leaves room for this session's files within the total
+            prune_replay_dirs((TRAINING_REPLAY_TOTAL_DISK_MB - TRAINING_REPLAY_DISK_MB) * 1024 * 1024, replay_root)
+
+        # Evaluation only ever acts, so skip the optimizer, target network and replay buffer
+        if eval_mode:
+            self.agent = InferenceAgent(
+                state_dim=state_dim,
+                action_dim=MAX_ACTIONS,
+                model_path=model_path,
+                initial_weights=initial_weights
+            )
+            return
+
         self.agent = DQNAgent(
             state_dim=state_dim,
-            action_dim=4,
+            action_dim=MAX_ACTIONS,
             model_path=model_path,
             save_interval=MODEL_SAVE_INTERVAL,
             batch_size=TRAINING_BATCH_SIZE,
-            buffer_size=TRAINING_BUFFER_SIZE
+            buffer_size=TRAINING_BUFFER_SIZE,
+            snapshot_interval=INFERENCE_SNAPSHOT_INTERVAL,
+            checkpoint_keep=CHECKPOINT_KEEP,
+            checkpoint_version_every=CHECKPOINT_VERSION_EVERY,
+            initial_weights=initial_weights,
+            replay_dir=os.path.join(replay_root, safe_name(session_id)) if TRAINING_REPLAY_ON_DISK else None,
+            replay_disk_bytes=TRAINING_REPLAY_DISK_MB * 1024 * 1024,
+            replay_state_dtype=TRAINING_REPLAY_STATE_DTYPE,
+            prioritized=TRAINING_PRIORITIZED_REPLAY,
+            priority_alpha=TRAINING_PRIORITY_ALPHA,
+            priority_beta=TRAINING_PRIORITY_BETA,
+            priority_beta_steps=TRAINING_PRIORITY_BETA_STEPS
         )
 
-        if eval_mode:
-            self.agent.epsilon = self.agent.epsilon_min  # Use trained epsilon (0.05)
-
-        for worker in self.world.workers:
-            worker.setup_worker()
-
     def step(self):
         """Execute one training step for all workers. Returns True if simulation should continue."""
         if not self.is_running or self.is_paused:
             return False
 
         with self.lock:
-            if self.world.is_finished():
-                if self.eval_mode:
+            step_start = time.perf_counter()
+            finished = self.world.is_finished()
+            self.timings.record('clean_ratio', time.perf_counter() - step_start)
+
+            if finished:
+                if self.eval_mode or self.planner_mode:
                     return False
                 self._reset_episode()
                 return True
 
+            if self.planner_mode:
+                return self._planner_step()
+
+            timings = self.timings
             step_reward = 0
             for worker in self.world.workers:
-                action = self.agent.act(worker.state)
+                t0 = time.perf_counter()
+                action = self.agent.act(worker.state, worker.action_mask)
+                t1 = time.perf_counter()
+                if self.recorder is not None:
+                    self.recorder.record_action(worker.current_actions[action] if action < len(worker.current_actions) else None)
                 next_state, reward, done = worker.play(action)
+                t2 = time.perf_counter()
+                timings.record('act', t1 - t0)
+                timings.record('apply_action', t2 - t1)
 
                 if not self.eval_mode:
-                    self.agent.remember(worker.state, action, reward, next_state, done)
+                    self.agent.remember(worker.state, action, reward, next_state, done, worker.action_mask)
+                    t3 = time.perf_counter()
                     self.agent.train()
+                    t4 = time.perf_counter()
+                    timings.record('remember', t3 - t2)
+                    timings.record('train', t4 - t3)
 
-                worker.state = worker.get_state()
+                # play() already observed the state after the move, so that is timed as part of apply_action
+                worker.state = next_state
                 step_reward += reward
 
             self.total_reward += step_reward
             self.episode_reward += step_reward
             self.step_count += 1
+            self.step_times.append(time.time())
+            timings.record('step', time.perf_counter() - step_start)
+            if self.recorder is not None:
+                self.recorder.record_step(self.step_count)
+            if not self.eval_mode and self.step_count % SESSION_SNAPSHOT_INTERVAL == 0:
+                self._snapshot()
 
             return True
 
+    def _planner_step(self):
+        """Advance every worker one action along its planned tour. Returns False once no worker has work left."""
+        step_start = time.perf_counter()
+        step_reward = 0
+        for worker in self.world.workers:
+            t0 = time.perf_counter()
+            action = self.planner.next_action(worker)
+            t1 = time.perf_counter()
+            self.timings.record('plan', t1 - t0)
+            if action is None:
+                continue
+            if self.recorder is not None:
+                self.recorder.record_action(action)
+
+            worker.state, reward, _ = worker.apply_action(action)
+            self.timings.record('apply_action', time.perf_counter() - t1)
+            step_reward += reward
+
+        self.total_reward += step_reward
+        self.episode_reward += step_reward
+        self.step_count += 1
+        self.step_times.append(time.time())
+        self.timings.record('step', time.perf_counter() - step_start)
+        if self.recorder is not None:
+            self.recorder.record_step(self.step_count)
+
+        return not self.planner.is_exhausted()
+
     def _reset_episode(self):
         """Reset the world for a new episode while keeping the trained agent."""
         self.episode += 1
@@ -95,14 +229,93 @@ class TrainingSession:
             worker.position = worker.sub_graph.nodes.__iter__().__next__()
             worker.setup_worker()
 
+        if self.recorder is not None:
+            self.recorder.record_step(self.step_count, keyframe=True)
+
     def start(self):
         with self.lock:
             self.is_running = True
             self.is_paused = False
+            # start() is called from the thread that runs the step loop
+            self.thread_id = threading.get_ident()
 
     def stop(self):
         with self.lock:
             self.is_running = False
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.agent is not None and not self.eval_mode:
+                # A session that never started would overwrite an earlier run's snapshot with a fresh agent
+                if self.thread_id is not None:
+                    self._snapshot()
+                # Replaces the flush _snapshot() queued: the buffer is flushed (or deleted) and its directory released
+                replay = self.agent.replay
+                from Checkpoint import get_writer
+                get_writer().submit(f'replay:{id(replay)}', lambda: replay.close(delete=not self.keep_replay))
+        self.stop_profiler()
+
+    def graph_fingerprint(self):
+        graph = self.world.graph
+        return [len(graph.edges), graph.most_left, graph.most_down, graph.most_right, graph.most_up]
+
+    def _snapshot(self):
+        """Save the session (world, counters, agent) in the background. Caller holds the lock.
+
+        The replay buffer isn't part of the file: its memory-mapped records are
+        already on disk, so only its fill level is synced alongside.
+        """
+        snapshot = {
+            'graph': self.graph_fingerprint(),
+            'session': {
+                'episode': self.episode,
+                'total_reward': self.total_reward,
+                'episode_reward': self.episode_reward,
+                'step_count': self.step_count
+            },
+            'world': capture_world(self.world),
+            'agent': self.agent.get_checkpoint()
+        }
+        save_snapshot(safe_name(self.session_id), snapshot, self.snapshot_dir)
+
+        from Checkpoint import get_writer
+        get_writer().submit(f'replay:{id(self.agent.replay)}', self.agent.replay.flush)
+
+    def restore(self, snapshot):
+        """Continue from a snapshot of this session. Returns False if it was taken on a different map, worker count or network shape."""
+        with self.lock:
+            if snapshot['graph'] != self.graph_fingerprint():
+                return False
+            # Checked before the world changes, so a rejected snapshot leaves the session entirely fresh
+            if not self.agent.fits(snapshot['agent']):
+                print(f"Snapshot network for session {self.session_id} does not fit this network")
+                return False
+            if not restore_world(self.world, snapshot['world']):
+                return False
+
+            self.agent.restore(snapshot['agent'])
+            session = snapshot['session']
+            self.episode = session['episode']
+            self.total_reward = session['total_reward']
+            self.episode_reward = session['episode_reward']
+            self.step_count = session['step_count']
+            return True
+
+    def start_profiler(self):
+        """Start sampling the step loop's stack. Returns False if it is already running or not started yet."""
+        if self.profiler is not None or self.thread_id is None:
+            return False
+
+        output_path = os.path.join(profiles_dir, f'{safe_name(self.session_id)}_{int(time.time())}.folded')
+        self.profiler = SamplingProfiler(self.thread_id, output_path, PROFILE_SAMPLE_INTERVAL)
+        self.profiler.start()
+        return True
+
+    def stop_profiler(self):
+        """Stop the sampling profiler and write its stacks. Returns the output path, or None if it wasn't running."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return None
+        return profiler.stop()
 
     def pause(self):
         with self.lock:
@@ -112,6 +325,13 @@ class TrainingSession:
         with self.lock:
             self.is_paused = False
 
+    def steps_per_second(self):
+        """Throughput over the recent step window, including the loop's sleeps and emits."""
+        step_times = list(self.step_times)
+        if len(step_times) < 2 or step_times[-1] == step_times[0]:
+            return 0.0
+        return (len(step_times) - 1) / (step_times[-1] - step_times[0])
+
     def get_state_update(self):
         """Get current state for streaming to frontend."""
         graph = self.world.graph
@@ -142,12 +362,16 @@ class TrainingSession:
 
     def get_training_metrics(self):
         """Get current training metrics."""
-        agent_metrics = self.agent.get_metrics()
+        agent_metrics = self.planner.get_metrics() if self.planner_mode else self.agent.get_metrics()
         return {
             'episode': self.episode,
             'total_reward': self.total_reward,
             'episode_reward': self.episode_reward,
             'step_count': self.step_count,
             'eval_mode': self.eval_mode,
+            'planner_mode': self.planner_mode,
+            'profiling': self.profiler is not None,
+            'recording': self.recorder.recording_id if self.recorder is not None else None,
+            'timings': self.timings.summary(),
             **agent_metrics
         }
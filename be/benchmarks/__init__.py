@@ -0,0 +1,4 @@
+"""Headless throughput benchmarks on synthetic road graphs.
+
+Run from the be/ directory: python -m benchmarks --graph city --nodes 2500
+"""
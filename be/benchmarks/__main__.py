@@ -0,0 +1,41 @@
+import argparse
+import json
+import sys
+
+from benchmarks.suite import BENCHMARKS, run_suite, compare
+from benchmarks.synthetic import GENERATORS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless benchmarks on synthetic road graphs.')
+    parser.add_argument('--graph', choices=GENERATORS.keys(), default='city')
+    parser.add_argument('--nodes', type=int, default=2500, help='approximate node count (at least a few hundred, so sub graphs exist)')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=int, default=10, help='multiplier for the number of operations per benchmark')
+    parser.add_argument('--only', nargs='*', choices=BENCHMARKS.keys())
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput drop versus the baseline')
+    args = parser.parse_args()
+
+    report = run_suite(args.graph, args.nodes, args.workers, args.seed, args.scale, args.only, not args.no_memory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
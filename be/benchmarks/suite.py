@@ -0,0 +1,266 @@
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Graph import Graph
+from Node import Node
+from Edge import Edge
+from SubGraph import generate_sub_graphs
+from World import World
+
+from benchmarks.synthetic import GENERATORS
+
+
+class BenchContext:
+    """Lazily built graph/world/session shared by the benchmarks of one run."""
+
+    def __init__(self, location, num_workers: int, seed: int, workdir: str):
+        self.location = location
+        self.num_workers = num_workers
+        self.seed = seed
+        self.workdir = workdir
+        self._world = None
+        # Called after the run, before workdir is deleted
+        self.teardown: list = []
+
+    @property
+    def world(self) -> World:
+        if self._world is None:
+            random.seed(self.seed)
+            self._world = World(self.location, self.num_workers)
+        return self._world
+
+
+def build_graph(location) -> Graph:
+    graph = Graph()
+    for start, end, oneway, priority in location.get_edges():
+        graph.add_edge(Edge(Node(start[0], start[1]), Node(end[0], end[1]), oneway, priority))
+    return graph
+
+# Every benchmark takes the context and returns (fn, ops, extra) where fn runs `ops`
+# operations of the thing being measured and extra holds additional result fields.
+
+def bench_graph_construction(ctx: BenchContext, scale: int):
+    edges = ctx.location.get_edges()
+    return (lambda: build_graph(ctx.location)), len(edges), {}
+
+def bench_generate_sub_graphs(ctx: BenchContext, scale: int):
+    graph = ctx.world.graph
+    return (lambda: generate_sub_graphs(graph)), 1, {'sub_graphs': len(ctx.world.sub_graphs)}
+
+def bench_find_neighbours_graph(ctx: BenchContext, scale: int):
+    graph = ctx.world.graph
+    rng = random.Random(ctx.seed)
+    nodes = rng.sample(tuple(graph.nodes), min(len(graph.nodes), 10 * scale))
+
+    def run():
+        for node in nodes:
+            graph.find_neighbours(node)
+    return run, len(nodes), {}
+
+def bench_find_neighbours_sub_graph(ctx: BenchContext, scale: int):
+    rng = random.Random(ctx.seed)
+    pairs = [(s, n) for s in ctx.world.sub_graphs for n in s.nodes]
+    pairs = rng.sample(pairs, min(len(pairs), 100 * scale))
+
+    def run():
+        for sub_graph, node in pairs:
+            sub_graph.find_neighbours(node)
+    return run, len(pairs), {}
+
+def bench_get_state(ctx: BenchContext, scale: int):
+    """Cold observations: every call rebuilds the worker, edge and action parts as if everything had just moved."""
+    graph = ctx.world.graph
+    workers = ctx.world.workers
+    repeats = 2 * scale
+
+    def run():
+        for _ in range(repeats):
+            for worker in workers:
+                # Invalidates the worker positions, the sub graph's edge features and the memoized observation
+                graph.position_version += 1
+                worker.sub_graph.clean_version += 1
+                worker.get_state()
+    return run, repeats * len(workers), {}
+
+def bench_get_state_warm(ctx: BenchContext, scale: int):
+    """Warm observations: nothing changed since the last call, so each is the memoized tuple."""
+    workers = ctx.world.workers
+    repeats = 200 * scale
+    for worker in workers:
+        worker.get_state()
+
+    def run():
+        for _ in range(repeats):
+            for worker in workers:
+                worker.get_state()
+    return run, repeats * len(workers), {}
+
+def bench_to_dict(ctx: BenchContext, scale: int):
+    graph = ctx.world.graph
+    payload_bytes = len(json.dumps(graph.to_dict()))
+    repeats = scale
+
+    def run():
+        for _ in range(repeats):
+            json.dumps(graph.to_dict())
+    return run, repeats, {'payload_bytes': payload_bytes}
+
+def bench_training_step(ctx: BenchContext, scale: int):
+    from api.training_session import TrainingSession
+
+    model_path = os.path.join(ctx.workdir, 'bench_model.pth')
+    # Replay files and snapshots stay in the run's temporary directory, out of the source tree
+    session = TrainingSession(
+        ctx.world, 'benchmark', ctx.num_workers, model_path=model_path,
+        replay_root=os.path.join(ctx.workdir, 'replay'), snapshot_dir=os.path.join(ctx.workdir, 'sessions')
+    )
+    session.start()
+    ctx.teardown.append(session.stop)
+    steps = 5 * scale
+
+    def run():
+        for _ in range(steps):
+            session.step()
+    return run, steps, {}
+
+def bench_agent_train(ctx: BenchContext, scale: int):
+    from Agent import DQNAgent
+    from api.training_session import compute_state_dim
+    from api.constants import TRAINING_BATCH_SIZE
+    from SubGraph import MAX_ACTIONS
+
+    state_dim = compute_state_dim()
+    agent = DQNAgent(
+        state_dim=state_dim,
+        action_dim=MAX_ACTIONS,
+        batch_size=TRAINING_BATCH_SIZE,
+        model_path=os.path.join(ctx.workdir, 'bench_agent.pth')
+    )
+    rng = random.Random(ctx.seed)
+    for _ in range(TRAINING_BATCH_SIZE * 4):
+        state = tuple(rng.random() for _ in range(state_dim))
+        next_state = tuple(rng.random() for _ in range(state_dim))
+        next_mask = tuple(i < rng.randint(1, MAX_ACTIONS) for i in range(MAX_ACTIONS))
+        agent.remember(state, rng.randrange(MAX_ACTIONS), rng.choice((-5, -2, 2, 7, 20)), next_state, False, next_mask)
+    steps = 5 * scale
+
+    def run():
+        for _ in range(steps):
+            agent.train()
+    return run, steps, {}
+
+BENCHMARKS = {
+    'graph_construction': bench_graph_construction,
+    'generate_sub_graphs': bench_generate_sub_graphs,
+    'find_neighbours_graph': bench_find_neighbours_graph,
+    'find_neighbours_sub_graph': bench_find_neighbours_sub_graph,
+    'get_state': bench_get_state,
+    'get_state_warm': bench_get_state_warm,
+    'to_dict': bench_to_dict,
+    'training_step': bench_training_step,
+    'agent_train': bench_agent_train,
+}
+
+
+def measure(fn, ops: int, track_memory: bool) -> dict:
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+
+    result = {
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_sec': ops / seconds if seconds > 0 else float('inf'),
+    }
+
+    # Second pass: tracemalloc slows Python code down too much to share the timed run
+    if track_memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_python_memory_bytes'] = peak
+
+    return result
+
+def max_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_suite(kind: str, num_nodes: int, num_workers: int = 10, seed: int = 0, scale: int = 10,
+              only: list[str] | None = None, track_memory: bool = True) -> dict:
+    """Run the selected benchmarks on one synthetic graph and return a JSON-serializable report."""
+    location = GENERATORS[kind](num_nodes, seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        # World writes its CSV cache relative to the working directory
+        os.chdir(workdir)
+        try:
+            ctx = BenchContext(location, num_workers, seed, workdir)
+            for name, bench in BENCHMARKS.items():
+                if only and name not in only:
+                    continue
+
+                entry = {'name': name}
+                try:
+                    # Benchmarked code logs with print; keep stdout clean for the report
+                    with contextlib.redirect_stdout(sys.stderr):
+                        fn, ops, extra = bench(ctx, scale)
+                        entry.update(measure(fn, ops, track_memory))
+                    entry.update(extra)
+                except ImportError as e:
+                    entry['skipped'] = f'missing dependency: {e.name}'
+                results.append(entry)
+                print(f"{name}: {entry.get('ops_per_sec', 0):.1f} ops/sec" if 'skipped' not in entry else f"{name}: {entry['skipped']}", file=sys.stderr)
+        finally:
+            with contextlib.redirect_stdout(sys.stderr):
+                for teardown in ctx.teardown:
+                    teardown()
+                # Pending checkpoint, snapshot and replay writes target workdir, which is about to be deleted
+                if 'Checkpoint' in sys.modules:
+                    sys.modules['Checkpoint'].get_writer().flush()
+            os.chdir(cwd)
+
+    graph = ctx.world.graph if ctx._world is not None else build_graph(location)
+    return {
+        'meta': {
+            'graph': kind,
+            'requested_nodes': num_nodes,
+            'nodes': len(graph.nodes),
+            'edges': len(graph.edges),
+            'num_workers': num_workers,
+            'seed': seed,
+            'scale': scale,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'max_rss_bytes': max_rss_bytes(),
+        },
+        'results': results,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Names of benchmarks whose throughput dropped more than `tolerance` below the baseline."""
+    previous = {r['name']: r for r in baseline.get('results', []) if 'ops_per_sec' in r}
+    regressions = []
+    for r in report['results']:
+        if 'ops_per_sec' not in r or r['name'] not in previous:
+            continue
+        ratio = r['ops_per_sec'] / previous[r['name']]['ops_per_sec']
+        print(f"{r['name']}: {ratio:.2f}x baseline", file=sys.stderr)
+        if ratio < 1 - tolerance:
+            regressions.append(r['name'])
+    return regressions
@@ -0,0 +1,125 @@
+import random
+
+from Location import RoadPriority
+
+# Roughly 100 m between intersections at Ottawa's latitude, so synthetic graphs
+# have the same coordinate scale as the OSMnx graphs the server builds.
+ORIGIN = (-75.90, 45.30)
+SPACING = 0.001
+
+class SyntheticLocation:
+    """Stand-in for Location that serves a generated road graph instead of an OSMnx download.
+
+    Exposes the same bounds and get_edges() shape that World consumes, with two-way
+    roads emitted once per direction like OSMnx does.
+    """
+
+    def __init__(self, edges: list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]):
+        self.edges = edges
+
+        xs = [p[0] for e in edges for p in (e[0], e[1])]
+        ys = [p[1] for e in edges for p in (e[0], e[1])]
+        self.most_left = min(xs)
+        self.most_right = max(xs)
+        self.most_down = min(ys)
+        self.most_up = max(ys)
+
+    def get_cache_name(self):
+        return f"synthetic_{self.most_down:.4f}_{self.most_left:.4f}_{self.most_up:.4f}_{self.most_right:.4f}.csv"
+
+    def get_edges(self) -> list[tuple[tuple[float, float], tuple[float, float], bool, RoadPriority]]:
+        return self.edges
+
+
+def _point(i: int, j: int, jitter: float = 0.0, rng: random.Random | None = None) -> tuple[float, float]:
+    x = ORIGIN[0] + i * SPACING
+    y = ORIGIN[1] + j * SPACING
+    if jitter and rng is not None:
+        x += rng.uniform(-jitter, jitter) * SPACING
+        y += rng.uniform(-jitter, jitter) * SPACING
+    return (x, y)
+
+def _add_road(edges: list, start, end, oneway: bool, priority: RoadPriority):
+    edges.append((start, end, oneway, priority))
+    if not oneway:
+        edges.append((end, start, oneway, priority))
+
+def _side(num_nodes: int) -> int:
+    return max(2, round(num_nodes ** 0.5))
+
+def grid_graph(num_nodes: int, seed: int = 0) -> SyntheticLocation:
+    """Square lattice of two-way residential streets."""
+    n = _side(num_nodes)
+    edges = []
+    for i in range(n):
+        for j in range(n):
+            if i + 1 < n:
+                _add_road(edges, _point(i, j), _point(i + 1, j), False, RoadPriority.RESIDENTIAL)
+            if j + 1 < n:
+                _add_road(edges, _point(i, j), _point(i, j + 1), False, RoadPriority.RESIDENTIAL)
+    return SyntheticLocation(edges)
+
+def planar_graph(num_nodes: int, seed: int = 0) -> SyntheticLocation:
+    """Jittered lattice with random edge removal and one random diagonal per cell.
+
+    Every edge stays inside its own cell, so the graph is planar by construction.
+    """
+    rng = random.Random(seed)
+    n = _side(num_nodes)
+    points = {(i, j): _point(i, j, 0.3, rng) for i in range(n) for j in range(n)}
+    priorities = list(RoadPriority)
+
+    edges = []
+    for i in range(n):
+        for j in range(n):
+            if i + 1 < n and rng.random() < 0.85:
+                _add_road(edges, points[(i, j)], points[(i + 1, j)], rng.random() < 0.1, rng.choice(priorities))
+            if j + 1 < n and rng.random() < 0.85:
+                _add_road(edges, points[(i, j)], points[(i, j + 1)], rng.random() < 0.1, rng.choice(priorities))
+            if i + 1 < n and j + 1 < n and rng.random() < 0.3:
+                if rng.random() < 0.5:
+                    _add_road(edges, points[(i, j)], points[(i + 1, j + 1)], False, rng.choice(priorities))
+                else:
+                    _add_road(edges, points[(i + 1, j)], points[(i, j + 1)], False, rng.choice(priorities))
+    return SyntheticLocation(edges)
+
+def city_graph(num_nodes: int, seed: int = 0) -> SyntheticLocation:
+    """Grid city: a motorway ring, primary/secondary arterials, one-way tertiary pairs and residential blocks."""
+    rng = random.Random(seed)
+    n = _side(num_nodes)
+    points = {(i, j): _point(i, j, 0.15, rng) for i in range(n) for j in range(n)}
+
+    def line_priority(k: int) -> tuple[RoadPriority, bool]:
+        if k == 0 or k == n - 1:
+            return RoadPriority.MOTORWAY, False
+        if k % 16 == 0:
+            return RoadPriority.TRUNK, False
+        if k % 8 == 0:
+            return RoadPriority.PRIMARY, False
+        if k % 4 == 0:
+            return RoadPriority.SECONDARY, False
+        if k % 4 == 2:
+            return RoadPriority.TERTIARY, True
+        return RoadPriority.RESIDENTIAL, False
+
+    edges = []
+    for i in range(n):
+        for j in range(n):
+            if i + 1 < n:
+                priority, oneway = line_priority(j)
+                # Residential blocks are not fully connected through
+                if priority != RoadPriority.RESIDENTIAL or rng.random() < 0.8:
+                    start, end = (points[(i, j)], points[(i + 1, j)]) if j % 8 != 6 else (points[(i + 1, j)], points[(i, j)])
+                    _add_road(edges, start, end, oneway, priority)
+            if j + 1 < n:
+                priority, oneway = line_priority(i)
+                if priority != RoadPriority.RESIDENTIAL or rng.random() < 0.8:
+                    start, end = (points[(i, j)], points[(i, j + 1)]) if i % 8 != 6 else (points[(i, j + 1)], points[(i, j)])
+                    _add_road(edges, start, end, oneway, priority)
+    return SyntheticLocation(edges)
+
+GENERATORS = {
+    'grid': grid_graph,
+    'planar': planar_graph,
+    'city': city_graph,
+}
@@ -216,6 +216,11 @@ function GraphOverlay({ graphData, mapBounds, numWorkers, onProgressUpdate, eval
         ctx.lineWidth = edge.oneway ? 0.8 : 1.2;
         ctx.beginPath();
         ctx.moveTo(start.x, start.y);
+        // Contracted roads list the points between their ends
+        (edge.path || []).forEach(point => {
+          const p = latLonToPixel(point.y, point.x);
+          ctx.lineTo(p.x, p.y);
+        });
         ctx.lineTo(end.x, end.y);
         ctx.stroke();
       });